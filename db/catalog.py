@@ -0,0 +1,106 @@
+'''
+Catalog of the component collections of every log,
+looked up by (log, component) instead of listing the collections of the database
+'''
+import uuid
+
+class CollectionCatalog():
+    '''
+    Maps (log, component) to the collection holding the component, its number of chunks
+    and a version that changes every time the component is written.
+    The catalog is kept in memory and persisted by the storage, it is updated by the
+    storage on every insert and drop
+    '''
+    def __init__(self, storage):
+        self.storage = storage
+        self.entries = None # (log, component) -> {'collection': name, 'chunks': n}
+
+    def refresh(self):
+        """reads the catalog from the storage
+        """
+        self.entries = {}
+        for log, comp, cname, chunks, version in self.storage.catalog_entries():
+            self.entries[(log, comp)] = {'collection': cname, 'chunks': chunks, 'version': version}
+
+    def lookup(self, log, comp):
+        """returns the collection of a component of a log
+
+        Parameters
+        ----------
+        log : str
+            log file name
+        comp : str
+            component name, matched exactly ('GPS' does not match 'GPS2')
+
+        Returns
+        -------
+        string
+            collection name
+        -1 if not found
+        """
+        entry = self._entry(log, comp)
+        if entry is None:
+            return -1
+        return entry['collection']
+
+    def _entry(self, log, comp):
+        if self.entries is None:
+            self.refresh()
+        entry = self.entries.get((log, comp))
+        if entry is None: # may have been written by another process since the last refresh
+            found = self.storage.catalog_find(log, comp)
+            if found is None:
+                return None
+            entry = self.entries[(log, comp)] = {'collection': found[0], 'chunks': found[1],
+                                                 'version': found[2]}
+        return entry
+
+    def components(self, log):
+        """returns the components of a log in the catalog
+        """
+        if self.entries is None:
+            self.refresh()
+        return [comp for (l, comp) in self.entries if l == log]
+
+    def add(self, log, comp, cname, chunks=None):
+        self.add_many([(log, comp, cname, chunks)])
+
+    def add_many(self, components):
+        """records components written together with a single catalog update,
+        the catalog is not read from the storage for it
+
+        Parameters
+        ----------
+        components : list
+            (log, component, collection, chunks) of the components written
+        """
+        entries = [(log, comp, cname, chunks, uuid.uuid4().hex)
+                   for log, comp, cname, chunks in components]
+        if len(entries) == 0:
+            return
+        if self.entries is not None: # otherwise read with the new entries on the next lookup
+            for log, comp, cname, chunks, version in entries:
+                self.entries[(log, comp)] = {'collection': cname, 'chunks': chunks, 'version': version}
+        self.storage.catalog_put(entries)
+
+    def remove(self, log, comp):
+        if self.entries is None:
+            self.refresh()
+        self.entries.pop((log, comp), None)
+        self.storage.catalog_delete(log, comp)
+
+
+def split_name(cname):
+    """splits a collection name <component>_<log> e.g. 'GPS_log1' -> ('log1', 'GPS')
+
+    Returns
+    -------
+    tuple
+        (log, component)
+    None
+        if the collection is not a component collection
+    """
+    if cname.startswith('_') or '_' not in cname: # catalog and staging collections
+        return None
+    comp, log = cname.split('_', 1)
+    return log, comp
@@ -1,93 +1,148 @@
+import os
 import pymongo
-
-class DatabaseConnector():
-
-    def __init__(self,dbname,port):
+from pymongo.write_concern import WriteConcern
+from db.storage import Storage
+from db.connection import get_client, release_client
+
+CATALOG = '_catalog' # collection holding the catalog in the database
+
+class DatabaseConnector(Storage):
+    '''
+    MongoDB storage, one collection per component of a log.
+    The client is shared with the other connectors of the process
+    '''
+    def __init__(self,dbname,port=None,uri=None):
+        """
+        dbname : str
+            database name
+        port : str
+            port of a server on localhost, used when uri is None
+        uri : str
+            mongodb uri, the one set with db.connection.configure if both are None
+        """
         self.dbname = dbname
         self.port = port
+        self.uri = uri
+        self.myclient = None
+        self._pid = None
         self.mycol = None
+        self._catalog_seeded = False # the catalog holds the collections written before it existed
         self.connectDB()
+        super().__init__()
 
     def connectDB(self):
+            uri = self.uri
+            if uri is None and self.port is not None:
+                uri = "mongodb://localhost:"+self.port+"/"
             try:
-                print("mongodb://localhost:"+self.port+"/")
-                self.myclient = pymongo.MongoClient("mongodb://localhost:"+self.port+"/")
+                self.myclient = get_client(uri)
                 print('Database connected')
             except:
                 print('Database connection error..')
                 return -1
-            self.mydb = self.myclient[self.dbname]
+            self._pid = os.getpid()
+            self._mydb = self.myclient[self.dbname]
+
+    @property
+    def mydb(self):
+        if self._pid != os.getpid(): # forked, the client of the parent process can not be used
+            self.connectDB()
+        return self._mydb
 
 
     def set_collection(self,cname):
+        super().set_collection(cname)
         self.mycol = self.mydb[cname]
 
-    def insert_dict(self,dict):
-        """creates and Insert dict into collection
-
-        Parameters
-        ----------
-        colname : str
-            Description of parameter `colname`.
-        dict : dict
-            Description of parameter `dict`.
-        """
-        try:
-            self.mycol.insert_one(dict)
-        except Exception as e:
-            print('error inserting dict to mongo')
-            print(e)
-            return -1
-
-    def dropdb(self,dbname):
-            self.myclient.drop_database(dbname)
-            print(f'{dbname} database deleted')
+    def list_collection_names(self):
+        return self.mydb.list_collection_names()
+
+    def collection_exists(self,cname):
+        return len(self.mydb.list_collection_names(filter={'name': cname})) > 0
+
+    def write_docs(self,cname,docs,write_concern=None,ordered=False):
+        wc = None
+        if write_concern is not None:
+            wc = write_concern if isinstance(write_concern, WriteConcern) else WriteConcern(**write_concern)
+        self.mydb.get_collection(cname, write_concern=wc).insert_many(docs, ordered=ordered)
+
+    def read_docs(self,cname,names=None,start=None,end=None):
+        query = {}
+        if start is not None or end is not None:
+            overlap = {}
+            if start is not None:
+                overlap['maxLineIndex'] = {'$gte': start}
+            if end is not None:
+                overlap['minLineIndex'] = {'$lte': end}
+            # documents written before the chunking have no line range
+            query = {'$or': [{'chunk': {'$exists': False}}, overlap]}
+        projection = None
+        if names is not None:
+            projection = dict.fromkeys(names + ['lineIndex', 'chunk'], 1)
+        self.mycol = self.mydb[cname]
+        return list(self.mycol.find(query, projection))
 
-    def query_str(self,sub):
-        """retruns a list of files that contains sub as a substring
+    def drop(self,cname):
+        self.mydb[cname].drop()
 
-        Parameters
-        ----------
-        sub : str
-            substring in the collection name
+    def rename(self,cname,target):
+        self.mydb[cname].rename(target, dropTarget=True)
 
-        Returns
-        -------
-        list
-            list of file names with vname in collection name
+    def collection_version(self,cname):
+        # collections written before the catalog existed have no version,
+        # the catalog gives a version to every component written since
+        return None
 
+    def _seed_catalog(self):
+        """builds the catalog collection from the collection names if the database
+        was written before the catalog existed, checked once per connector
         """
-        return [c for c in self.mydb.list_collection_names() if sub in c]
-
-
-    def query(self,collection_name,variable=None):
-        """return list of values for a variable within a component collection
-
-        Parameters
-        ----------
-        collection_name : str
-            Description of parameter `collection_name`.
-        variable : str
-            if this value is none the query returns the collection as dict
-        Returns
-        -------
-        int
-            -1 if key error
-        list
-            list of values for the variables requested
+        if self._catalog_seeded:
+            return
+        if self.mydb[CATALOG].find_one() is None:
+            self._catalog_seeded = True # before the put, which seeds too
+            self.catalog_put(super().catalog_entries())
+        self._catalog_seeded = True
+
+    def catalog_entries(self):
+        """reads the catalog collection, seeded from the collection names
+        if the database was written before the catalog existed
         """
-        self.mycol = self.mydb[collection_name]
-        for x in self.mycol.find():
-            try:
-                if variable is None:
-                    return  x
-                else:
-                    return x[variable]
-            except:
-                return -1
+        self._seed_catalog()
+        return [(x['log'], x['component'], x['collection'], x.get('chunks'), x.get('version'))
+                for x in self.mydb[CATALOG].find()]
+
+    def catalog_find(self,log,comp):
+        x = self.mydb[CATALOG].find_one({'log': log, 'component': comp})
+        if x is None: # e.g. written by the code before the catalog
+            return super().catalog_find(log, comp)
+        return x['collection'], x.get('chunks'), x.get('version')
+
+    def catalog_put(self,entries):
+        self._seed_catalog() # the first write must not hide the legacy collections
+        # one round trip for all the components of a log
+        requests = [pymongo.ReplaceOne({'log': log, 'component': comp},
+                                       {'log': log, 'component': comp, 'collection': cname,
+                                        'chunks': chunks, 'version': version},
+                                       upsert=True)
+                    for log, comp, cname, chunks, version in entries]
+        if len(requests) > 0:
+            self.mydb[CATALOG].bulk_write(requests, ordered=False)
+
+    def catalog_delete(self,log,comp):
+        self.mydb[CATALOG].delete_many({'log': log, 'component': comp})
+
+    def dropdb(self,dbname):
+            self.myclient.drop_database(dbname)
+            print(f'{dbname} database deleted')
+            if dbname == self.dbname:
+                self.catalog.entries = None
+                self._catalog_seeded = False
 
     def close_connection(self):
-        self.myclient.close()
+        if self.myclient is not None: # closed once no connector of the process uses it
+            release_client(self.myclient)
+            self.myclient = None
 
 
     #add queries for segments
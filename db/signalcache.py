@@ -0,0 +1,104 @@
+'''
+Read-through cache of the signals read from the storage,
+keeps the most recently used signals within a memory budget
+'''
+import sys
+import numpy as np
+from collections import OrderedDict
+
+DEFAULT_MB = 256 # default memory budget of the cache
+
+
+def nbytes(value):
+    """returns the approximate memory used by the values of a signal
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class SignalCache():
+    '''
+    LRU cache of the signals keyed by (log, component, variable, version),
+    the version of a component changes every time it is written so a new
+    version of a log is never answered from the cache.
+
+    Cached arrays are read only, lists are copied when they are returned
+    '''
+    def __init__(self, max_bytes=DEFAULT_MB << 20):
+        """
+        max_bytes : int
+            memory budget, the least recently used signals are evicted above it
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict() # key -> (values, size), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """returns the values of a signal
+
+        Returns
+        -------
+        tuple
+            (True, values) if the signal is cached, (False, None) otherwise.
+            values is None for a variable known to be missing from the component
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        values = entry[0]
+        return True, list(values) if isinstance(values, list) else values
+
+    def put(self, key, values):
+        """adds a signal to the cache, values larger than the whole budget are not cached
+        """
+        if isinstance(values, np.ndarray):
+            values.setflags(write=False) # shared by all the readers
+        size = nbytes(values) if values is not None else 0
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        self.entries[key] = (values, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def invalidate(self, log, comp):
+        """removes the signals of a component, used when it is written or dropped
+        """
+        for key in [k for k in self.entries if k[0] == log and k[1] == comp]:
+            self.nbytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """returns the hit and miss counters and the memory used
+
+        Returns
+        -------
+        dict
+            hits, misses, hit ratio, number of signals and bytes cached
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit ratio': self.hits / total if total > 0 else np.nan,
+                'signals': len(self.entries),
+                'bytes': self.nbytes}
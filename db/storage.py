@@ -0,0 +1,756 @@
+'''
+Storage backends of the extracted log components,
+all of them offer the DatabaseConnector API so the rest of the code does not
+depend on where the components are stored
+'''
+import os
+import abc
+import json
+import shutil
+import numpy as np
+from urllib.parse import quote, unquote
+from db.catalog import CollectionCatalog, split_name
+from db.signalcache import SignalCache, DEFAULT_MB
+
+CHUNK_ROWS = 10000 # rows of a component per document, keeps documents far below the 16 MB limit
+BACKENDS = ('mongo', 'directory', 'memory')
+TIME_COLUMNS = ['TimeUS', 'TimeMS'] # timestamps of the rows, used to align signals on time
+
+
+class Storage(abc.ABC):
+    '''
+    Base class of the storage backends.
+
+    Every component of a log is a collection named <component>_<log> holding
+    documents of CHUNK_ROWS rows. The backends implement the abstract primitives
+    (list_collection_names, collection_exists, write_docs, read_docs, drop, rename, dropdb,
+    collection_version), the inserts, queries and the catalog are built on top of them
+    '''
+    def __init__(self):
+        self.cname = None # collection used by insert_dict
+        self.catalog = CollectionCatalog(self) # (log, component) -> collection
+        self.cache = None # SignalCache of the columns read, not used if None
+
+    # primitives implemented by the backends
+
+    @abc.abstractmethod
+    def list_collection_names(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def collection_exists(self, cname):
+        """checks if a collection is stored, without listing all the collections
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def write_docs(self, cname, docs, write_concern=None, ordered=False):
+        """appends documents to a collection, created if it does not exist
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read_docs(self, cname, names=None, start=None, end=None):
+        """returns the documents of a collection overlapping the lineIndex window,
+        with at least the variables in names (all of them if None), lineIndex and chunk
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def drop(self, cname):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def rename(self, cname, target):
+        """renames a collection, replacing the target if it exists
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def dropdb(self, dbname):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def collection_version(self, cname):
+        """returns a value that changes every time the collection is written
+        """
+        raise NotImplementedError
+
+    def close_connection(self):
+        pass
+
+    # catalog, derived from the collection names unless the backend persists it
+
+    def catalog_entries(self):
+        """returns the (log, component, collection, chunks, version) of all the components stored
+        """
+        entries = []
+        for cname in self.list_collection_names():
+            key = split_name(cname)
+            if key is not None:
+                entries.append((key[0], key[1], cname, None, self.collection_version(cname)))
+        return entries
+
+    def catalog_find(self, log, comp):
+        """returns (collection, chunks, version) of a component, None if it is not stored
+        """
+        cname = comp + '_' + log
+        if self.collection_exists(cname):
+            return cname, None, self.collection_version(cname)
+        return None
+
+    def catalog_put(self, entries):
+        """persists (log, component, collection, chunks, version) entries in one update
+        """
+        pass
+
+    def catalog_delete(self, log, comp):
+        pass
+
+    # DatabaseConnector API
+
+    def set_collection(self, cname):
+        self.cname = cname
+
+    def insert_dict(self, dict):
+        """creates and Insert dict into collection, split in documents of CHUNK_ROWS rows,
+        the previous content of the collection is replaced
+
+        Parameters
+        ----------
+        dict : dict
+            variable -> values of a component
+        """
+        try:
+            docs = self._chunks(dict)
+            self._write_collection(self.cname, docs)
+        except Exception as e:
+            print('error inserting dict to the database')
+            print(e)
+            return -1
+        self._catalog_add([(self.cname, len(docs))])
+
+    def insert_log(self, filename, components, write_concern=None, ordered=False, replace=False):
+        """writes all the components of a log, each component is written to the
+        collection <component>_<filename> with a single batched insert
+
+        Parameters
+        ----------
+        filename : str
+            log file name
+        components : dict
+            component name -> dict of variable -> values
+        write_concern : dict
+            write concern of the inserts e.g. {'w': 1, 'j': False}, the database default if None
+        ordered : bool
+            stop a batch at the first failed document
+        replace : bool
+            replace the collections of the components, each one is written to a staging
+            collection that is renamed over the previous one.
+            The collections that already exist are always replaced, exporting
+            a log twice never appends a second copy of its rows
+
+        Returns
+        -------
+        dict
+            component name -> None if it was written, the error message otherwise
+        """
+        status = {}
+        written = [] # (collection, chunks), added to the catalog together
+        for comp, data in components.items():
+            cname = comp + '_' + filename
+            try:
+                docs = self._chunks(data)
+                self._write_collection(cname, docs, write_concern, ordered, replace)
+                written.append((cname, len(docs)))
+                status[comp] = None
+            except Exception as e:
+                status[comp] = str(e)
+        self._catalog_add(written)
+        return status
+
+    def _write_collection(self, cname, docs, write_concern=None, ordered=False, replace=False):
+        """writes the documents of a collection, through a staging collection
+        renamed over it if it is replaced or already exists
+        """
+        if not replace and not self.collection_exists(cname):
+            self.write_docs(cname, docs, write_concern, ordered)
+            return
+        staging = '_staging_' + cname
+        self.drop(staging)
+        self.write_docs(staging, docs, write_concern, ordered)
+        self.rename(staging, cname)
+
+    def drop_collection(self, cname):
+        self.drop(cname)
+        key = split_name(cname)
+        if key is not None:
+            self.catalog.remove(key[0], key[1])
+            if self.cache is not None:
+                self.cache.invalidate(key[0], key[1])
+
+    def query_str(self, sub):
+        """retruns a list of files that contains sub as a substring
+
+        Parameters
+        ----------
+        sub : str
+            substring in the collection name
+
+        Returns
+        -------
+        list
+            list of file names with vname in collection name
+
+        """
+        return [c for c in self.list_collection_names() if sub in c]
+
+    def query(self, collection_name, variable=None, start=None, end=None):
+        """return list of values for a variable within a component collection,
+        only the requested variables and the chunks overlapping the window are read
+
+        Parameters
+        ----------
+        collection_name : str
+            Description of parameter `collection_name`.
+        variable : str or list
+            if this value is none the query returns the collection as dict,
+            a list of variables returns a dict with these variables only
+        start : int
+            first lineIndex of the window, from the first row if None
+        end : int
+            last lineIndex of the window (included), until the last row if None
+        Returns
+        -------
+        int
+            -1 if key error
+        list
+            list of values for the variables requested, the chunks of the
+            component are joined in the order of the lines
+        """
+        names = None
+        if variable is not None:
+            names = [variable] if isinstance(variable, str) else list(variable)
+        try:
+            if start is not None or end is not None or self.cache is None:
+                return self._assemble(self.read_docs(collection_name, names, start, end),
+                                      variable, start, end)
+            cols = self._read_columns(collection_name, names)
+        except:
+            return -1
+        if cols is None or variable is None:
+            return cols
+        if any(k not in cols for k in names):
+            return -1
+        return cols[variable] if isinstance(variable, str) else cols
+
+    def fetch_signals(self, log, signals, align=None):
+        """fetches several signals of a log with one query per component
+
+        Parameters
+        ----------
+        log : str
+            log file name
+        signals : list or dict
+            'COMP_Var' names e.g. ['ATT_Yaw', 'GPS_Alt'] or component -> variables
+            e.g. {'ATT': ['Yaw'], 'GPS': ['Alt']} as returned by load_top100_dict
+        align : str
+            None to return every signal with its own rows, 'lineIndex' or 'time' to
+            align all the signals on the union of their line numbers or timestamps
+            (seconds from TimeUS or TimeMS), missing values are forward filled
+
+        Returns
+        -------
+        dict
+            'COMP_Var' -> array, signals that are not stored are left out.
+            Aligned signals are float arrays (object arrays for non numeric signals)
+            and the dict has an extra 'lineIndex' or 'time' array
+        """
+        if isinstance(signals, dict):
+            wanted = {comp: list(names) for comp, names in signals.items()}
+        else:
+            wanted = {}
+            for sig in signals:
+                comp, var = sig.split('_', 1)
+                wanted.setdefault(comp, []).append(var)
+        res = {}
+        keys = {} # 'COMP_Var' -> line numbers or timestamps of its rows
+        for comp, names in wanted.items():
+            cname = self.catalog.lookup(log, comp)
+            if cname == -1:
+                continue
+            extra = ['lineIndex'] if align != 'time' else TIME_COLUMNS
+            cols = self._read_columns(cname, list(names) + extra)
+            if cols is None:
+                continue
+            key = None
+            if align == 'lineIndex':
+                key = np.asarray(cols.get('lineIndex'))
+            elif align == 'time':
+                if 'TimeUS' in cols:
+                    key = np.asarray(cols['TimeUS'], dtype=np.float64) / 1e6
+                elif 'TimeMS' in cols:
+                    key = np.asarray(cols['TimeMS'], dtype=np.float64) / 1e3
+                else: # can not be aligned on time
+                    continue
+            for var in names:
+                if var in cols:
+                    res[comp + '_' + var] = np.asarray(cols[var])
+                    keys[comp + '_' + var] = key
+        if align is None:
+            return res
+        union = np.unique(np.concatenate(list(keys.values()))) if len(keys) > 0 else np.array([])
+        aligned = {align: union}
+        for sig, values in res.items():
+            aligned[sig] = ffill_on(keys[sig], values, union)
+        return aligned
+
+    def _read_columns(self, cname, names=None):
+        """reads whole columns of a collection, through the signal cache if there is one
+
+        Parameters
+        ----------
+        cname : str
+            collection name
+        names : list
+            variables to read, all of them if None
+
+        Returns
+        -------
+        dict
+            variable -> values of the variables found in the collection
+        None
+            if the collection is empty
+        """
+        key = split_name(cname)
+        found = None
+        if self.cache is not None and key is not None:
+            # the version is read from the storage so writes of other processes are seen
+            found = self.catalog_find(key[0], key[1])
+        if found is None:
+            docs = self.read_docs(cname, names)
+            if len(docs) == 0:
+                return None
+            if names is None:
+                return self._assemble(docs)
+            return {k: self._assemble(docs, k) for k in names if k in docs[0]}
+        log, comp = key
+        version = found[2]
+        if names is None: # the variable names of the component are cached too
+            found, all_names = self.cache.get((log, comp, '*', version))
+            if not found:
+                docs = self.read_docs(cname)
+                if len(docs) == 0:
+                    return None
+                cols = self._assemble(docs)
+                for k, v in cols.items():
+                    self.cache.put((log, comp, k, version), v)
+                self.cache.put((log, comp, '*', version), list(cols.keys()))
+                return cols
+            names = all_names
+        cols = {}
+        missing = []
+        for k in names:
+            found, v = self.cache.get((log, comp, k, version))
+            if not found:
+                missing.append(k)
+            elif v is not None:
+                cols[k] = v
+        if len(missing) > 0:
+            docs = self.read_docs(cname, missing)
+            if len(docs) == 0:
+                return None
+            for k in missing:
+                v = self._assemble(docs, k) if k in docs[0] else None # None: not in the component
+                self.cache.put((log, comp, k, version), v)
+                if v is not None:
+                    cols[k] = v
+        return {k: cols[k] for k in names if k in cols}
+
+    def _catalog_add(self, written):
+        """records the written (collection, chunks) in the catalog
+        """
+        components = []
+        for cname, chunks in written:
+            key = split_name(cname)
+            if key is not None:
+                components.append((key[0], key[1], cname, chunks))
+                if self.cache is not None:
+                    self.cache.invalidate(key[0], key[1])
+        self.catalog.add_many(components)
+
+    def _chunks(self, dict):
+        """splits the columns of a component in documents of CHUNK_ROWS consecutive rows,
+        each document has the range of line numbers it covers and its position
+
+        Returns
+        -------
+        list
+            documents to insert
+        """
+        columns = {k: v for k, v in dict.items() if isinstance(v, (list, np.ndarray))}
+        nrows = max([len(v) for v in columns.values()] + [0])
+        line_index = dict.get('lineIndex')
+        docs = []
+        for i, start in enumerate(range(0, max(nrows, 1), CHUNK_ROWS)):
+            doc = {k: pack(v[start:start + CHUNK_ROWS]) if k in columns else v
+                   for k, v in dict.items()}
+            doc['chunk'] = i
+            if line_index is not None and len(line_index[start:start + CHUNK_ROWS]) > 0:
+                doc['minLineIndex'] = int(line_index[start])
+                doc['maxLineIndex'] = int(line_index[min(start + CHUNK_ROWS, nrows) - 1])
+            docs.append(doc)
+        return docs
+
+    def _assemble(self, docs, variable=None, start=None, end=None):
+        """joins the chunks of a component back in a single dict,
+        only keeping the rows with a lineIndex between start and end
+
+        Returns
+        -------
+        dict
+            variable -> list of values, if variable is None or a list
+        list
+            values of the variable
+        None
+            if the collection is empty
+        """
+        if len(docs) == 0:
+            return None
+        window = start is not None or end is not None
+        if 'chunk' not in docs[0] and not window: # single document written before the chunking
+            if variable is None:
+                return docs[0]
+            if isinstance(variable, str):
+                return docs[0][variable]
+            return {k: docs[0][k] for k in variable}
+        docs = sorted(docs, key=lambda x: x.get('chunk', 0))
+        if len(set(x.get('chunk', 0) for x in docs)) < len(docs):
+            # e.g. a log exported twice by an older version, the first copy is read
+            print('Duplicate chunks in a collection, only the first copy of each chunk is read')
+            first = {}
+            for x in docs:
+                first.setdefault(x.get('chunk', 0), x)
+            docs = list(first.values())
+        if variable is None:
+            names = [k for k in docs[0] if k not in ('_id', 'chunk', 'minLineIndex', 'maxLineIndex')]
+        else:
+            names = [variable] if isinstance(variable, str) else variable
+        if window and 'lineIndex' in docs[0] and 'lineIndex' not in names:
+            names = names + ['lineIndex']
+        res = {}
+        for k in names:
+            parts = [unpack(x[k]) for x in docs]
+            if all(isinstance(p, np.ndarray) for p in parts):
+                res[k] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+            elif isinstance(parts[0], (list, np.ndarray)):
+                res[k] = [e for p in parts for e in p]
+            else:
+                res[k] = parts[0]
+        if window and 'lineIndex' in docs[0]:
+            keep = np.ones(len(res['lineIndex']), dtype=bool)
+            if start is not None:
+                keep &= np.asarray(res['lineIndex']) >= start
+            if end is not None:
+                keep &= np.asarray(res['lineIndex']) <= end
+            for k in res:
+                if isinstance(res[k], np.ndarray):
+                    res[k] = res[k][keep]
+                elif isinstance(res[k], list):
+                    res[k] = [e for e, kept in zip(res[k], keep) if kept]
+        if isinstance(variable, str):
+            return res[variable]
+        if variable is not None and 'lineIndex' not in variable:
+            res.pop('lineIndex', None)
+        return res
+
+
+def pack(values):
+    """numeric arrays are stored as little-endian bytes with their dtype and shape,
+    other values as plain lists
+
+    Returns
+    -------
+    dict
+        {'dtype', 'shape', 'data'} for numeric arrays
+    list
+        values of the other columns
+    """
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind in 'biuf':
+            arr = values.astype(values.dtype.newbyteorder('<'), copy=False)
+            return {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'data': arr.tobytes()}
+        return values.tolist()
+    return values
+
+
+def unpack(value):
+    """decodes a packed column without copying its bytes, the array is read only
+
+    Returns
+    -------
+    array
+        if the value is a packed column
+    the value unchanged otherwise
+    """
+    if isinstance(value, dict) and 'data' in value and 'dtype' in value:
+        return np.frombuffer(value['data'], dtype=np.dtype(value['dtype'])).reshape(value['shape'])
+    return value
+
+def ffill_on(keys, values, target):
+    """reindexes values recorded at keys on the target keys,
+    each target takes the last value recorded at or before it (nan before the first one)
+    """
+    order = np.argsort(keys, kind='stable')
+    keys = np.asarray(keys)[order]
+    values = values[order]
+    if values.dtype.kind in 'biuf':
+        values = values.astype(np.float64)
+        missing = np.nan
+    else:
+        values = values.astype(object)
+        missing = None
+    pos = np.searchsorted(keys, target, side='right') - 1
+    out = values[np.maximum(pos, 0)] if len(values) > 0 else np.empty(len(target), dtype=values.dtype)
+    out[pos < 0] = missing
+    return out
+
+
+def overlaps(doc, start, end):
+    """checks if a document overlaps the lineIndex window,
+    documents without line range (written before the chunking) always do
+    """
+    if 'minLineIndex' not in doc:
+        return 'chunk' not in doc
+    return ((start is None or doc['maxLineIndex'] >= start)
+            and (end is None or doc['minLineIndex'] <= end))
+
+
+def project(doc, names):
+    if names is None:
+        return dict(doc)
+    return {k: doc[k] for k in names + ['lineIndex', 'chunk'] if k in doc}
+
+
+_memory_dbs = {} # dbname -> collections, shared by the memory storages of the process
+_memory_versions = {} # (dbname, collection) -> number of writes
+
+
+class MemoryStorage(Storage):
+    '''
+    Components kept in memory, shared by all the memory storages
+    of the process with the same database name. Used for tests
+    '''
+    def __init__(self, dbname='vardb'):
+        self.dbname = dbname
+        self.collections = _memory_dbs.setdefault(dbname, {}) # name -> list of documents
+        super().__init__()
+
+    def list_collection_names(self):
+        return list(self.collections.keys())
+
+    def collection_exists(self, cname):
+        return cname in self.collections
+
+    def write_docs(self, cname, docs, write_concern=None, ordered=False):
+        self.collections.setdefault(cname, []).extend(dict(d) for d in docs)
+        self._written(cname)
+
+    def _written(self, cname):
+        key = (self.dbname, cname)
+        _memory_versions[key] = _memory_versions.get(key, 0) + 1
+
+    def collection_version(self, cname):
+        return _memory_versions.get((self.dbname, cname), 0)
+
+    def read_docs(self, cname, names=None, start=None, end=None):
+        return [project(d, names) for d in self.collections.get(cname, [])
+                if overlaps(d, start, end)]
+
+    def drop(self, cname):
+        self.collections.pop(cname, None)
+        self._written(cname)
+
+    def rename(self, cname, target):
+        self.collections[target] = self.collections.pop(cname)
+        self._written(cname)
+        self._written(target)
+
+    def dropdb(self, dbname):
+        collections = _memory_dbs.setdefault(dbname, {})
+        for cname in collections: # cleared in place, shared with the other storages
+            _memory_versions[(dbname, cname)] = _memory_versions.get((dbname, cname), 0) + 1
+        collections.clear()
+        if dbname == self.dbname:
+            self.catalog.entries = None
+
+
+class DirectoryStorage(Storage):
+    '''
+    Components stored in a directory without database server:
+    <path>/<dbname>/<collection>/ holds one .npz file per chunk with one array
+    per numeric or text variable, a .json file per chunk with the variables mixing
+    text and numbers, and a meta.json with the line range of every chunk.
+    Nothing is stored as pickled objects
+    '''
+    def __init__(self, path, dbname='vardb'):
+        self.path = path
+        self.dbname = dbname
+        self.root = os.path.join(path, dbname)
+        os.makedirs(self.root, exist_ok=True)
+        super().__init__()
+
+    def _dir(self, cname):
+        return os.path.join(self.root, quote(cname, safe=''))
+
+    def _meta(self, cname):
+        meta_path = os.path.join(self._dir(cname), 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def list_collection_names(self):
+        return [unquote(d) for d in os.listdir(self.root)
+                if os.path.exists(os.path.join(self.root, d, 'meta.json'))]
+
+    def collection_exists(self, cname):
+        return os.path.exists(os.path.join(self._dir(cname), 'meta.json'))
+
+    def write_docs(self, cname, docs, write_concern=None, ordered=False):
+        path = self._dir(cname)
+        os.makedirs(path, exist_ok=True)
+        meta = self._meta(cname) or {'chunks': []}
+        for doc in docs:
+            n = len(meta['chunks'])
+            arrays = {}
+            mixed = {}
+            entry = {'file': '{}.npz'.format(n), 'scalars': {}}
+            for k, v in doc.items():
+                if k in ('chunk', 'minLineIndex', 'maxLineIndex'):
+                    entry[k] = v
+                elif isinstance(v, list):
+                    arr = column_array(v)
+                    if arr is None:
+                        mixed[k] = [e.item() if isinstance(e, np.generic) else e for e in v]
+                    else:
+                        arrays[k] = arr
+                elif isinstance(unpack(v), np.ndarray): # packed numeric column
+                    arrays[k] = unpack(v)
+                else:
+                    entry['scalars'][k] = v
+            entry['columns'] = list(arrays.keys())
+            np.savez(os.path.join(path, entry['file']), **{str(i): a for i, a in enumerate(arrays.values())})
+            if len(mixed) > 0:
+                entry['mixed'] = '{}.json'.format(n)
+                with open(os.path.join(path, entry['mixed']), 'w') as f:
+                    json.dump(mixed, f)
+            meta['chunks'].append(entry)
+        # the chunks are visible once the meta file is replaced
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    def read_docs(self, cname, names=None, start=None, end=None):
+        meta = self._meta(cname)
+        if meta is None:
+            return []
+        docs = []
+        for entry in meta['chunks']:
+            if not overlaps(entry, start, end):
+                continue
+            doc = dict(entry['scalars'])
+            for k in ('chunk', 'minLineIndex', 'maxLineIndex'):
+                if k in entry:
+                    doc[k] = entry[k]
+            with np.load(os.path.join(self._dir(cname), entry['file']), allow_pickle=False) as data:
+                for i, k in enumerate(entry['columns']):
+                    if names is None or k in names or k == 'lineIndex':
+                        arr = data[str(i)]
+                        doc[k] = arr if arr.dtype.kind in 'biuf' else arr.tolist()
+            if 'mixed' in entry:
+                with open(os.path.join(self._dir(cname), entry['mixed'])) as f:
+                    for k, values in json.load(f).items():
+                        if names is None or k in names:
+                            doc[k] = values
+            docs.append(project(doc, names))
+        return docs
+
+    def collection_version(self, cname):
+        # a renamed staging directory has a new inode, an append a new modification time
+        st = os.stat(os.path.join(self._dir(cname), 'meta.json'))
+        return '{}-{}'.format(st.st_ino, st.st_mtime_ns)
+
+    def drop(self, cname):
+        shutil.rmtree(self._dir(cname), ignore_errors=True)
+
+    def rename(self, cname, target):
+        self.drop(target)
+        os.replace(self._dir(cname), self._dir(target))
+
+    def dropdb(self, dbname):
+        shutil.rmtree(os.path.join(self.path, dbname), ignore_errors=True)
+        if dbname == self.dbname:
+            os.makedirs(self.root, exist_ok=True)
+            self.catalog.entries = None
+
+
+def column_array(values):
+    """converts a list of values to a numeric or text array
+
+    Returns
+    -------
+    array
+    None
+        if the values mix strings and other values (e.g. nan), they can not be
+        stored as an array without turning the numbers into strings
+    """
+    if any(isinstance(v, str) for v in values) and not all(isinstance(v, str) for v in values):
+        return None
+    arr = np.asarray(values)
+    if arr.dtype.kind not in 'biufUS':
+        return None
+    return arr
+
+
+def get_connector(dbname='vardb', port=None, backend=None, path=None, uri=None, cache_mb=None):
+    """returns the storage of the components, the backend is chosen by the
+    environment variables when it is not given
+
+    Parameters
+    ----------
+    dbname : str
+        database name
+    port : str
+        port of a mongo server on localhost, DRONE_DB_PORT if None
+    backend : str
+        'mongo', 'directory' or 'memory', DRONE_DB_BACKEND or 'mongo' if None
+    path : str
+        root of the directory backend, DRONE_DB_PATH or 'vardb_store' if None
+    uri : str
+        mongodb uri, the one of db.connection (DRONE_DB_URI) if uri and port are None
+    cache_mb : float
+        memory budget of the signal cache in MB, DRONE_SIGNAL_CACHE_MB or 256 if None,
+        no cache if 0
+
+    Returns
+    -------
+    Storage
+    """
+    if backend is None:
+        backend = os.environ.get('DRONE_DB_BACKEND', 'mongo')
+    if backend == 'mongo':
+        from db.database import DatabaseConnector
+        storage = DatabaseConnector(dbname, port or os.environ.get('DRONE_DB_PORT'), uri)
+    elif backend == 'directory':
+        storage = DirectoryStorage(path or os.environ.get('DRONE_DB_PATH', 'vardb_store'), dbname)
+    elif backend == 'memory':
+        storage = MemoryStorage(dbname)
+    else:
+        raise ValueError('unknown storage backend {}, expected one of {}'.format(backend, BACKENDS))
+    if cache_mb is None:
+        cache_mb = float(os.environ.get('DRONE_SIGNAL_CACHE_MB', DEFAULT_MB))
+    if cache_mb > 0:
+        storage.cache = SignalCache(int(cache_mb * (1 << 20)))
+    return storage
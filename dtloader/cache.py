@@ -0,0 +1,151 @@
+'''
+On-disk columnar cache of parsed logs,
+keyed by a content hash of the log and the parser version
+'''
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+PARSER_VERSION = 1 # bump when the output of the parsing changes, invalidates the cache
+
+
+def file_hash(filepath, blocksize=1 << 20):
+    """returns the sha1 hash of the content of a file
+    """
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class LogCache():
+    '''
+    Directory of parsed logs, one sub directory per log with one .npy file
+    per column of every component and a meta.json describing the components
+    '''
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, filepath):
+        return '{}_v{}'.format(file_hash(filepath), PARSER_VERSION)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.path(key), 'meta.json'))
+
+    def open(self, key):
+        """opens a cached log, the columns are memory-mapped
+
+        Returns
+        -------
+        CachedLog
+        """
+        return CachedLog(self.path(key))
+
+    def writer(self, key):
+        return CacheWriter(self.path(key))
+
+
+class CacheWriter():
+    '''
+    Writes the components of a log to a temporary directory
+    that replaces the cache entry once all the components are written
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = '{}.tmp{}'.format(path, os.getpid())
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+        self.meta = {'version': PARSER_VERSION, 'order': [], 'components': {}}
+
+    def add(self, comp, labels, fmt, cols=None):
+        """adds a component to the cache entry
+
+        Parameters
+        ----------
+        comp : str
+            component name
+        labels : list
+            variable names from the FMT line
+        fmt : str
+            format string of the component
+        cols : dict
+            extracted columns, None if the component could not be extracted
+        """
+        entry = {'labels': list(labels), 'format': fmt, 'columns': None}
+        if cols is not None:
+            os.makedirs(os.path.join(self.tmp_path, comp))
+            for i, values in enumerate(cols.values()):
+                arr = np.asarray(values)
+                if arr.dtype.kind == 'O': # mixed values are kept as strings
+                    arr = arr.astype(str)
+                np.save(os.path.join(self.tmp_path, comp, '{}.npy'.format(i)), arr)
+            entry['columns'] = list(cols.keys())
+        self.meta['order'].append(comp)
+        self.meta['components'][comp] = entry
+
+    def commit(self):
+        with open(os.path.join(self.tmp_path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+        try:
+            os.replace(self.tmp_path, self.path)
+        except OSError: # written by another process in the meantime
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def discard(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class CachedLog():
+    '''
+    Cached log, offers the same interface as the log readers
+    so it can be used by the dataloader in place of parsing the file
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    @property
+    def components(self):
+        return list(self.meta['order'])
+
+    def labels(self, comp):
+        entry = self.meta['components'].get(comp)
+        if entry is None:
+            return None
+        return list(entry['labels'])
+
+    def format_string(self, comp):
+        return self.meta['components'][comp]['format']
+
+    def ncolumns(self, comp):
+        entry = self.meta['components'][comp]
+        if entry['columns'] is None: # let the columns call report the error
+            return len(entry['labels'])
+        return len(entry['columns']) - 1 # without lineIndex
+
+    def columns(self, comp, names):
+        """returns the memory-mapped columns of a component
+
+        Returns
+        -------
+        dict
+            name -> array, including the lineIndex column
+        int
+            -1 if the component could not be extracted when cached
+        """
+        entry = self.meta['components'][comp]
+        if entry['columns'] is None:
+            return -1
+        cols = {}
+        for i, name in enumerate(entry['columns']):
+            cols[name] = np.load(os.path.join(self.path, comp, '{}.npy'.format(i)), mmap_mode='r')
+        return cols
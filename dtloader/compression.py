@@ -0,0 +1,77 @@
+'''
+Transparent reading of compressed logs (gzip, xz, zstd),
+the logs are decompressed as a stream without temporary files
+'''
+import io
+import gzip
+import lzma
+try:
+    import zstandard
+except ImportError: # zstd logs are not supported without the zstandard package
+    zstandard = None
+
+READ_BUFFER = 1 << 20 # size of the buffer of the decompressed zstd stream
+
+# magic bytes at the start of the file -> compression
+MAGIC = {b'\x1f\x8b': 'gzip',
+         b'\xfd7zXZ\x00': 'xz',
+         b'\x28\xb5\x2f\xfd': 'zstd'}
+EXTENSIONS = ('.gz', '.xz', '.zst')
+
+
+def compression(filepath):
+    """returns the compression of a file from its first bytes
+
+    Returns
+    -------
+    str
+        'gzip', 'xz' or 'zstd'
+    None
+        if the file is not compressed
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(6)
+    for magic, name in MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def strip_extension(filepath):
+    """removes the compression extension e.g. 'data/log1.log.gz' -> 'data/log1.log'
+    """
+    for ext in EXTENSIONS:
+        if filepath.lower().endswith(ext):
+            return filepath[:-len(ext)]
+    return filepath
+
+
+def open_log(filepath, mode='rt'):
+    """opens a log file, compressed files are decompressed while reading
+
+    Parameters
+    ----------
+    filepath : str
+        path of the log
+    mode : str
+        'rt' for text logs, 'rb' for binary logs
+
+    Returns
+    -------
+    file object
+    """
+    kind = compression(filepath)
+    if kind is None:
+        return open(filepath, mode)
+    if kind == 'gzip':
+        return gzip.open(filepath, mode)
+    if kind == 'xz':
+        return lzma.open(filepath, mode)
+    if zstandard is None:
+        raise ImportError('zstandard is required to read .zst logs')
+    raw = open(filepath, 'rb')
+    stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True),
+                               buffer_size=READ_BUFFER)
+    if 't' in mode:
+        return io.TextIOWrapper(stream)
+    return stream
@@ -0,0 +1,182 @@
+'''
+Reader for binary DataFlash (.bin) logs,
+decodes the records of each component in one batch using NumPy structured dtypes
+'''
+import mmap
+import struct
+import numpy as np
+from dtloader.formats import FORMAT_TYPES, DECODED_TYPES, record_dtype
+from dtloader.compression import compression, open_log
+
+HEADER = b'\xa3\x95' # every message starts with these two bytes
+FMT_TYPE = 128 # message type of the FMT messages
+FMT_LENGTH = 89 # length of a FMT message including the header
+FMT_STRUCT = struct.Struct('<BB4s16s64s') # type, length, name, format, columns
+
+
+def _to_str(raw):
+    return raw.split(b'\x00')[0].decode('ascii', 'ignore').strip()
+
+
+class DataFlashReader():
+    '''
+    Reads a binary DataFlash log, the file is scanned once to find the offsets
+    of the messages of every component, the records are decoded on request
+    '''
+    def __init__(self, use_mmap=False):
+        """
+        use_mmap : bool
+            memory-map the file instead of reading it into memory,
+            compressed logs are always read into memory
+        """
+        self.use_mmap = use_mmap
+        self.data = None
+        self.formats = {} # message type -> (name, format, labels, length)
+        self.types = {} # component name -> message type
+        self.offsets = {} # message type -> list of record offsets
+        self.line_index = {} # message type -> list of message numbers
+        self.nlines = 0 # number of messages found
+
+    def read(self, filepath):
+        """reads and scans a .bin log
+
+        Parameters
+        ----------
+        filepath : str
+            path of the log
+        """
+        if compression(filepath) is not None: # compressed logs are decompressed in memory
+            with open_log(filepath, 'rb') as f:
+                self.data = f.read()
+        else:
+            with open(filepath, 'rb') as f:
+                if self.use_mmap:
+                    self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self.data = f.read()
+        self._scan()
+
+    def _scan(self):
+        """walks through the messages and records the offsets per message type,
+        bytes that do not belong to a known message are skipped until the next header
+        """
+        data = self.data
+        lengths = {FMT_TYPE: FMT_LENGTH}
+        n = len(data)
+        off = 0
+        while off + 3 <= n:
+            if data[off] != HEADER[0] or data[off + 1] != HEADER[1]:
+                off = data.find(HEADER, off + 1)
+                if off == -1:
+                    break
+                continue
+            mtype = data[off + 2]
+            length = lengths.get(mtype)
+            if length is None or off + length > n: # unknown or truncated message
+                off += 1
+                continue
+            if mtype == FMT_TYPE:
+                ftype, flength, name, fmt, labels = FMT_STRUCT.unpack_from(data, off + 3)
+                if ftype not in self.formats:
+                    name = _to_str(name)
+                    labels = [l.strip() for l in _to_str(labels).split(',') if l.strip() != '']
+                    self.formats[ftype] = (name, _to_str(fmt), labels, flength)
+                    self.types[name] = ftype
+                    lengths[ftype] = flength
+            if mtype not in self.offsets:
+                self.offsets[mtype] = []
+                self.line_index[mtype] = []
+            self.offsets[mtype].append(off)
+            self.line_index[mtype].append(self.nlines)
+            self.nlines += 1
+            off += length
+
+    def close(self):
+        """releases the content of the log, unmapping the file if it was memory-mapped.
+        The columns already returned are copies and stay valid
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+
+    @property
+    def components(self):
+        return [self.formats[t][0] for t in self.offsets if t in self.formats]
+
+    def labels(self, comp):
+        """returns the variable names of a component from its FMT message
+
+        Returns
+        -------
+        list
+        None
+            if the component has no FMT message
+        """
+        mtype = self.types.get(comp)
+        if mtype is None:
+            return None
+        return list(self.formats[mtype][2])
+
+    def ncolumns(self, comp):
+        return len(self.formats[self.types[comp]][1])
+
+    def format_string(self, comp):
+        mtype = self.types.get(comp)
+        if mtype is None:
+            return None
+        return self.formats[mtype][1]
+
+    def records(self, comp):
+        """decodes all the records of a component in one batch
+
+        Returns
+        -------
+        numpy structured array
+        None
+            if the format of the component cannot be decoded
+        """
+        mtype = self.types[comp]
+        name, fmt, labels, length = self.formats[mtype]
+        dtype = record_dtype(fmt, labels, length - 3)
+        if dtype is None:
+            return None
+        offs = np.array(self.offsets[mtype], dtype=np.int64) + 3
+        raw = np.frombuffer(self.data, dtype=np.uint8)
+        # gather the payload bytes of every record from a strided view of the log,
+        # one row of itemsize bytes starting at each byte, without building a byte index
+        windows = np.lib.stride_tricks.sliding_window_view(raw, dtype.itemsize)
+        return windows[offs].view(dtype).reshape(-1)
+
+    def columns(self, comp, names):
+        """returns the decoded columns of a component with the given names
+
+        Parameters
+        ----------
+        comp : str
+            component name
+        names : list
+            column names, one per format char
+
+        Returns
+        -------
+        dict
+            name -> numpy array of values, including the lineIndex column
+        """
+        mtype = self.types[comp]
+        fmt, labels = self.formats[mtype][1:3]
+        recs = self.records(comp)
+        if recs is None:
+            return -1
+        cols = {}
+        for name, label, ch in zip(names, labels, fmt):
+            values = recs[label]
+            scale = FORMAT_TYPES[ch][1]
+            if scale is not None:
+                values = values * scale
+            elif values.dtype.kind == 'S':
+                values = np.array([_to_str(v) for v in values])
+            if ch in DECODED_TYPES:
+                values = values.astype(DECODED_TYPES[ch])
+            cols[name] = values
+        cols['lineIndex'] = np.array(self.line_index[mtype])
+        return cols
@@ -8,28 +8,70 @@ import pymongo
 import numpy as np
 import os
 import sys
+import json
+from collections import Counter
 module_path = os.path.abspath(os.path.join('..'))
 if module_path not in sys.path:
     sys.path.append(module_path)
-from db.database import DatabaseConnector
+from db.storage import get_connector
+from dtloader.logparser import LogParser, CHUNK_LINES
+from dtloader.dataflash import DataFlashReader
+from dtloader.formats import decode_column, text_values
+from dtloader.cache import LogCache
+from dtloader.logindex import LogIndex
+from dtloader.compression import compression, open_log, strip_extension
+
+EXPORT_BATCH_VALUES = 10000000 # number of values exported to the database in one batch
 
 class DataLoader():
 
-    def __init__(self):
+    def __init__(self,cache_dir=None,write_concern=None):
         '''
         init a dataloader instance
+
+        cache_dir : str
+            directory of the parsed logs cache, logs are parsed every time if None
+        write_concern : dict
+            write concern of the exported components e.g. {'w': 1}, the database default if None
         '''
         #list of errors recorded while loading the data
         self.errors_list = []
         # list with all variable detected (can contain duplicates)
         self.var_list = []
-        self.dbconnector = DatabaseConnector('vardb','27017')
+        # number of occurences of each variable, updated while extracting
+        self.var_counts = Counter()
+        self.dbconnector = get_connector('vardb') # backend chosen by DRONE_DB_BACKEND
         self.full_dict = {}
+        self.cache = LogCache(cache_dir) if cache_dir is not None else None
+        self.cache_key = None
+        self.selected = None
+        self.reader = None # reader of the loaded log when it is not held in a dataframe
+        self.write_concern = write_concern
+        self.export_status = {} # component -> None if exported, the error message otherwise
 
-    def load(self,filepath):
+    def load(self,filepath,stream=False,chunksize=CHUNK_LINES,use_mmap=False,components=None):
         """load file into a pandas data frame and extract log information into required
         format type
 
+        Parameters
+        ----------
+        filepath : str
+            path of the log file
+        stream : bool
+            parse the log in chunks of lines into a buffer per component
+            instead of a single dataframe, each chunk is decoded into typed
+            columns so only one chunk of lines is ever held as text
+        chunksize : int
+            number of lines read per chunk in stream mode
+        use_mmap : bool
+            memory-map binary (.bin) logs instead of reading them into memory
+        components : list
+            only load these components (e.g. FailureDetector.COMPONENTS), the lines
+            of text logs are found with a byte offset index of the log built once
+
+        Logs compressed with gzip, xz or zstd (e.g. log1.log.gz) are decompressed
+        while they are read.
+
         Returns
         -------
         int
@@ -37,14 +79,39 @@ class DataLoader():
             returns 1 if loading was successfull
 
         """
+        self._close_reader() # the previous log was not extracted
         self.filepath = filepath
+        basepath = strip_extension(self.filepath) # e.g. data/log1.log.gz -> data/log1.log
         try:
-            self.filename = self.filepath[self.filepath.index('/') + 1:-4]
+            self.filename = basepath[basepath.index('/') + 1:-4]
         except: #given filename
-            self.filename = self.filepath
+            self.filename = basepath
+
+        self.selected = None if components is None else set(components)
+        self.cache_key = None
+        if self.cache is not None:
+            try:
+                self.cache_key = self.cache.key(self.filepath)
+            except: #file not found, reported by the loading below
+                pass
+            if self.cache_key is not None and self.cache.exists(self.cache_key):
+                # already parsed, the cached columns are used instead
+                self.df = None
+                self.reader = self.cache.open(self.cache_key)
+                self.components = self._select(self.reader.components)
+                return 1
+
+        if basepath.lower().endswith('.bin'):
+            return self._load_bin(use_mmap)
+        if self.selected is not None:
+            return self._load_index()
+        if stream:
+            return self._load_stream(chunksize)
+        self.reader = None
 
         try:  # parse error handling for log files
-            df = pd.read_csv(self.filepath, names=range(30), low_memory=False)
+            with open_log(self.filepath) as f:
+                df = pd.read_csv(f, names=range(30), low_memory=False)
         except:
             print('Broken log file / File not found')
             self.errors_list.append(-1)
@@ -69,66 +136,241 @@ class DataLoader():
             #self.components = self.df.index.unique() # not unique
             self.components = self.df[0].unique()
             #filter components to ones with spaces
+            self._split_components()
         except:
             print('Error in extracting components')
             self.errors_list.append(-3)
             return -3  # data not complete
         return 1  # read successfully
 
-    def extractinfo(self,export=False,single_file=False):
+    def _split_components(self):
+        """splits the dataframe rows by component in a single grouping pass
+        and builds the component -> variable names and format tables from the FMT lines once
+        """
+        # component -> positions of its rows in the dataframe
+        self.comp_rows = self.df.groupby(0, sort=False).indices
+        self.schema = {}
+        self.fmt_strings = {}
+        if 'FMT' not in self.comp_rows:
+            return
+        for row in self.df.iloc[self.comp_rows['FMT']].values:
+            if row[3] in self.schema: # the first definition of a component is the one used
+                continue
+            # removing nan values
+            c_labels = [ob for ob in row[5:18] if not pd.isnull(ob)]
+            self.schema[row[3]] = [str(c).strip() for c in c_labels]  # cleaning the spaces
+            if isinstance(row[4], str):
+                self.fmt_strings[row[3]] = row[4].strip()
+
+    def _load_stream(self,chunksize):
+        """load the file through the streaming parser, the components are kept
+        in the parser buffers until extractinfo is called
+
+        Returns
+        -------
+        int
+            same return codes as load
+        """
+        self.df = None
+        self.reader = LogParser(chunksize)
+        try:
+            with open_log(self.filepath) as f:
+                self.reader.parse(f)
+        except:
+            print('Broken log file / File not found')
+            self.errors_list.append(-1)
+            return -1  # broken file
+
+        if self.reader.nlines <= 1:  # empty log
+            print('Empty Dataframe')
+            self.errors_list.append(-2)
+            return -2
+        self.components = self.reader.components
+        return 1
+
+    def _load_bin(self,use_mmap):
+        """load a binary DataFlash log, the records of each component
+        are decoded when extractinfo is called
+
+        Returns
+        -------
+        int
+            same return codes as load
+        """
+        self.df = None
+        self.reader = DataFlashReader(use_mmap)
+        try:
+            self.reader.read(self.filepath)
+        except:
+            print('Broken log file / File not found')
+            self.errors_list.append(-1)
+            return -1  # broken file
+
+        if self.reader.nlines <= 1:  # empty log
+            print('Empty Dataframe')
+            self.errors_list.append(-2)
+            return -2
+        self.components = self._select(self.reader.components)
+        return 1
+
+    def _load_index(self):
+        """load only the selected components of a text log, their lines are read
+        using the byte offset index of the log and routed to the streaming parser
+
+        Returns
+        -------
+        int
+            same return codes as load
+        """
+        self.df = None
+        self.reader = LogParser(components=self.selected)
+        index_dir = self.cache.cache_dir if self.cache is not None else None
+        try:
+            if compression(self.filepath) is not None:
+                # compressed logs cannot be read at an offset, the other lines are skipped
+                with open_log(self.filepath) as f:
+                    self.reader.parse(f)
+            else:
+                index = LogIndex.for_file(self.filepath, index_dir)
+                for line, line_idx in index.read_lines(self.filepath, ['FMT'] + list(self.selected)):
+                    self.reader.route(line, line_idx)
+                self.reader.nlines = index.nlines
+        except:
+            print('Broken log file / File not found')
+            self.errors_list.append(-1)
+            return -1  # broken file
+
+        if self.reader.nlines <= 1:  # empty log
+            print('Empty Dataframe')
+            self.errors_list.append(-2)
+            return -2
+        self.components = self.reader.components
+        return 1
+
+    def _select(self, components):
+        """filters the components to the ones requested in load
+        """
+        if self.selected is None:
+            return components
+        return [c for c in components if c in self.selected]
+
+    def extractinfo(self,export=False,single_file=False,replace=False):
         """Extract variable information from dataframe for each component
+
+        Parameters
+        ----------
+        export : bool
+            export the components to the database
+        single_file : bool
+            keep the components in full_dict
+        replace : bool
+            the log was exported before, its collections are replaced and the
+            collections of components that are not in the log anymore are dropped
+
         Returns
         -------
         list of dataframes for each component
         """
+        #parsed logs are written to the cache unless they come from it
+        writer = None
+        if (self.cache_key is not None and self.selected is None
+                and not self.cache.exists(self.cache_key)):
+            writer = self.cache.writer(self.cache_key)
+        try:
+            self._extract_components(writer, export, single_file, replace)
+        except:
+            if writer is not None: #a partial entry is never left in the cache
+                writer.discard()
+            raise
+        self._close_reader() #the components are extracted, the binary log is not needed anymore
+
+    def _extract_components(self, writer, export, single_file, replace):
+        """extracts the components of the loaded log, see extractinfo
+
+        Parameters
+        ----------
+        writer : CacheWriter
+            cache entry the components are written to, None if they are not cached
+        """
+        exported = set() #collections replaced for this log
+        self.export_status = {}
+        pending = {} #components written to the database together
+        pending_values = 0
         #creating an empty collection
         for c in self.components:
             if c == 'FMT': #ignoring FMT as a variable
                 continue
-            variable_name_list = []
-            if 'FMT' in self.df[0].values:
-                # getting all the values
-                #c_labels = self.df.loc['FMT'][self.df.loc['FMT'][3] == c]
-
-                c_labels = self.df.loc[self.df[0] == 'FMT'].loc[self.df[3] == c]
-                if len(c_labels) > 0: #if that component was not found in the logs
-                    c_labels =  c_labels.values[0][5:18]
-                else: #empty FMT
-                    continue
-
-                # removing nan values
-                c_labels = [ob for ob in c_labels if not ob is np.nan]
-                c_labels = np.array([str(c).strip() for c in c_labels])  # cleaning the spaces
-                var_recor = [c+'_'+sub for sub in c_labels]
-                variable_name_list = [sub for sub in c_labels] #this is used for the exported dataframe
-                self.var_list += var_recor #this is used for variable counting
-                if 'RCIN_C13' in var_recor:
-                    print('Variable exists here : ', self.filename)
-                df_comp = self._non_equalcolumns(c, variable_name_list)
-                if isinstance(df_comp,int): #component has inconsistent columns
-                    print('Error in log', self.filename)
-                    continue
-                #add line index column to the dataframe
-
-            else: #FMT Not in dataframe
+            c_labels = self._component_labels(c)
+            if c_labels is None: #component without FMT
+                continue
+            var_recor = [c+'_'+sub for sub in c_labels]
+            variable_name_list = [sub for sub in c_labels] #this is used for the exported dataframe
+            self.var_list += var_recor
+            self.var_counts.update(var_recor) #this is used for variable counting
+            if 'RCIN_C13' in var_recor:
+                print('Variable exists here : ', self.filename)
+
+            if self.df is None: #streamed or binary log, columns come from the reader
+                cols = self._reader_component(c, variable_name_list)
+            else:
+                cols = self._non_equalcolumns(c, variable_name_list)
+            if isinstance(cols,int): #component has inconsistent columns
+                print('Error in log', self.filename)
+                if writer is not None:
+                    writer.add(c, c_labels, '')
                 continue
             #add to dict and create a new collection for the data
+            c_fmt = self._component_format(c)
             self.mydict= {}
-            for col in df_comp.columns:
-                    try: #if parsing to numeric fails the variable is ignored
-                        self.mydict[col]= pd.to_numeric(df_comp[col]).tolist()
-                        #insert dict into db
-                    except:
-                        #cannot be converted to numeric
-                        self.mydict[col]= df_comp[col].tolist()
-                        self.errors_list.append(-5)
+            for i,col in enumerate(cols):
+                #columns are decoded using the format char at the same position
+                ch = c_fmt[i] if col != 'lineIndex' and i < len(c_fmt) else None
+                self.mydict[col] = self._convert_column(cols[col], ch)
             if export:
-                self.dbconnector.set_collection(c+'_'+self.filename)
-                resp = self.dbconnector.insert_dict(self.mydict)
-                if resp == -1:
-                    print('Dict insert error in file : {}'.format(self.filename))
+                pending[c] = self.mydict
+                pending_values += sum(len(v) for v in self.mydict.values())
+                exported.add(c+'_'+self.filename)
+                if pending_values >= EXPORT_BATCH_VALUES: #bounds the memory held by the batch
+                    self._export(pending, replace)
+                    pending = {}
+                    pending_values = 0
             if single_file: #this is added when testing on a single file and not exporting
                 self.full_dict[(self.filename,c)] = self.mydict.copy()
+            if writer is not None:
+                writer.add(c, c_labels, c_fmt, self.mydict)
+        if writer is not None:
+            writer.commit()
+        if len(pending) > 0:
+            self._export(pending, replace)
+        if export and replace: #drop components of the previous version of the log
+            for comp in self.dbconnector.catalog.components(self.filename):
+                cname = self.dbconnector.catalog.lookup(self.filename, comp)
+                if cname not in exported:
+                    self.dbconnector.drop_collection(cname)
+
+    def _close_reader(self):
+        """closes the reader of a binary log, e.g. unmaps the file
+        """
+        if isinstance(self.reader, DataFlashReader):
+            self.reader.close()
+            self.reader = None
+
+    def _export(self, components, replace=False):
+        """writes a batch of components of the log to the database
+
+        Parameters
+        ----------
+        components : dict
+            component name -> dict of variable -> values
+        replace : bool
+            replace the previous collections of the components
+        """
+        status = self.dbconnector.insert_log(self.filename, components, self.write_concern,
+                                             replace=replace)
+        for c, err in status.items():
+            if err is not None:
+                print('Dict insert error in file : {} component {}'.format(self.filename, c))
+        self.export_status.update(status)
 
     def getcount(self):
         """returns a dataframe with the number of occurences for each variable found in the log files
@@ -136,18 +378,144 @@ class DataLoader():
         -------
         dataframe ['variable','count']
         """
-        if len(self.var_list) > 1:
-            dt = {}
-            uniq_var = set(self.var_list)
-            for el in uniq_var:
-                self.var_list.count(el)
-                dt[el] = self.var_list.count(el)
-        # dataframe
-            return pd.DataFrame(dt, index=['count']).transpose()
+        if len(self.var_counts) > 0:
+            return pd.DataFrame(dict(self.var_counts), index=['count']).transpose()
         else:
             print('Please run load before trying to get count')
             return -1
 
+    def top_variables(self,n=100,path=None):
+        """returns the n most frequent variables, in the format of top_100_variables.csv
+
+        Parameters
+        ----------
+        n : int
+            number of variables
+        path : str
+            if given the table is exported to this csv file
+
+        Returns
+        -------
+        dataframe ['name','count']
+        """
+        df = pd.DataFrame(self.var_counts.most_common(n), columns=['name','count'])
+        if path is not None:
+            df.to_csv(path)
+        return df
+
+    def merge_counts(self,counts):
+        """adds the variable counts of another loader (e.g. of a worker process)
+
+        Parameters
+        ----------
+        counts : dict
+            variable -> number of occurences
+        """
+        self.var_counts.update(counts)
+
+    def save_counts(self,path):
+        with open(path, 'w') as f:
+            json.dump(dict(self.var_counts), f)
+
+    def load_counts(self,path):
+        """merges the variable counts saved with save_counts
+        """
+        with open(path) as f:
+            self.merge_counts(json.load(f))
+
+    def _component_labels(self, comp):
+        """returns the variable names of a component as defined in its FMT line
+
+        Returns
+        -------
+        list
+            cleaned variable names
+        None
+            if the log or the component has no FMT line
+        """
+        if self.df is None:
+            return self.reader.labels(comp)
+        return self.schema.get(comp)
+
+    def _component_format(self, comp):
+        """returns the format string of a component e.g. 'QBIHBcLLeeEe',
+        an empty string if it is unknown
+        """
+        if self.df is None:
+            fmt = self.reader.format_string(comp)
+        else:
+            fmt = self.fmt_strings.get(comp)
+        return fmt if fmt is not None else ''
+
+    def _convert_column(self, values, ch=None):
+        """converts the values of a column to the numpy type of its format char,
+        columns without a known format are converted to numeric
+
+        Parameters
+        ----------
+        values : list, series or array
+            values of the column
+        ch : str
+            format char of the column
+
+        Returns
+        -------
+        array
+            typed values
+        list
+            the values stripped, or parsed if they are numbers, if the column cannot be converted
+        """
+        if ch is not None:
+            decoded = decode_column(values, ch)
+            if decoded is not None:
+                return decoded
+        try: #if parsing to numeric fails the variable is kept as it is
+            return np.asarray(pd.to_numeric(values))
+        except:
+            #cannot be converted to numeric
+            self.errors_list.append(-5)
+            return text_values(values)
+
+    def _reader_component(self, comp, var_list):
+        """same as _non_equalcolumns for a component held by the stream parser
+        or the binary reader
+
+        Returns
+        -------
+        dict
+            column name -> values, including the lineIndex column
+        int
+            -1 if the columns do not match the variable list
+        """
+        var_list = self._match_columns(comp, var_list, self.reader.ncolumns(comp))
+        if var_list == -1:
+            return -1
+        return self.reader.columns(comp, var_list)
+
+    def _match_columns(self, comp, var_list, ncols):
+        """matches the var list extracted from FMT to the number of columns of
+        the component, dummy names are added for the extra columns
+
+        Returns
+        -------
+        list
+            corrected column names
+        int
+            -1 if there are more variables than columns
+        """
+        cnter=0
+        if len(var_list) < ncols:
+                # calculate the difference and add dummy columns
+                 for i in range(ncols -  len(var_list)):
+                            var_list.append(comp+'_'+str(cnter))
+                            cnter+=1
+        if len(var_list) > ncols:
+                    return -1
+        #check if it's RollIn instead of DesRoll
+        if comp == 'ATT':
+            self._fix_varlist(var_list)
+        return var_list
+
     def _non_equalcolumns(self, comp, var_list):
         """Checks the var list vs the dataframe column list and
         creates a dataframe with the corrected column names for a specified component
@@ -171,24 +539,16 @@ class DataLoader():
         # dataframe with only the variable added
 
         try:
-            df_comp = self.df.loc[self.df[0] == comp].dropna(axis=1, how='all')
+            df_comp = self.df.iloc[self.comp_rows[comp]].dropna(axis=1, how='all')
             idx = df_comp.index
             df_comp = df_comp.set_index(0)
         except:
                 # component not in the dataframe
                 return -1
             # variables are always less than columns in the log files
-        cnter=0
-        if len(var_list) < len(df_comp.columns):
-                # calculate the difference and add dummy columns
-                 for i in range(len(df_comp.columns) -  len(var_list)):
-                            var_list.append(comp+'_'+str(cnter))
-                            cnter+=1
-        if len(var_list) > len(df_comp.columns):
-                    return -1
-        #check if it's RollIn instead of DesRoll
-        if comp == 'ATT':
-            self._fix_varlist(var_list)
+        var_list = self._match_columns(comp, var_list, len(df_comp.columns))
+        if var_list == -1:
+            return -1
         #----------------------------------------
         df_comp.columns = var_list.copy()
 
@@ -0,0 +1,215 @@
+'''
+Follow mode for text logs that are still being written,
+only the lines appended since the last poll are parsed and checked for failures
+'''
+import os
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+from dtloader.dataloader import DataLoader
+from dtloader.logparser import LogParser
+from failure_detector.rules import paired_components
+
+
+class LogFollower():
+    '''
+    Watches a growing text log, the new lines are routed to the component
+    buffers of a parser kept between polls and the failure rules are run
+    on the new rows only.
+
+    The failure flags are sticky: once a failure is detected it stays detected.
+    Checks comparing the samples of different components (e.g. GPS_RAlt and BARO_Alt)
+    pair them by position from the start of the log, so these components are
+    evaluated on all the rows read so far instead of the new ones.
+    '''
+    def __init__(self, filepath, detector=None, poll=1.0, on_failure=None, components=None):
+        """
+        filepath : str
+            path of the log being written
+        detector : FailureDetector
+            detector used to run the rules on the new rows, no detection if None
+        poll : float
+            seconds between two reads of the file
+        on_failure : function
+            called with (label, flags) when a failure is detected for the first time
+        components : list
+            only keep these components (e.g. FailureDetector.COMPONENTS), all of them if None
+        """
+        self.filepath = filepath
+        self.detector = detector
+        self.poll_interval = poll
+        self.on_failure = on_failure
+        self.components = components
+        self.paired = paired_components(detector.RULES) if detector is not None else set()
+        self.loader = DataLoader()
+        self.loader.df = None
+        self.loader.filename = os.path.basename(filepath)[:-4]
+        self._stop = False
+        self.reset()
+
+    def reset(self):
+        """forgets everything read so far, the file is read again from the start
+        """
+        self.parser = LogParser(components=self.components)
+        self.offset = 0 # byte offset of the first line not read yet
+        self.partial = b'' # last line of the previous read, not complete yet
+        self.tables = {} # component -> GrowingTable of all the rows read
+        self.flags = {}
+
+    def read_new(self):
+        """reads the complete lines appended since the last read and routes them
+        to the parser
+
+        Returns
+        -------
+        int
+            number of lines read
+            -1 if the file could not be read
+        """
+        try:
+            size = os.path.getsize(self.filepath)
+            if size < self.offset: # truncated or replaced by a new log
+                self.reset()
+            with open(self.filepath, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return -1
+        self.offset += len(data)
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop() # empty if the data ends with a complete line
+        self.parser.feed([line.decode('utf-8', 'replace') for line in lines])
+        return len(lines)
+
+    def poll(self):
+        """reads the new lines, extracts their components and runs the rules on them
+
+        Returns
+        -------
+        dict
+            component -> dict of variable -> values of the new rows
+        """
+        if self.read_new() <= 0:
+            return {}
+        self.loader.reader = self.parser
+        self.loader.components = self.parser.components
+        self.loader.full_dict = {}
+        self.loader.var_list = []
+        self.loader.var_counts = Counter()
+        self.loader.extractinfo(single_file=True)
+        new = {c: cols for (f, c), cols in self.loader.full_dict.items()}
+        for c in new:
+            self.tables.setdefault(c, GrowingTable()).append(new[c])
+        if self.detector is not None and len(new) > 0:
+            tables = dict(new)
+            for c in self.paired & set(self.tables):
+                tables[c] = self.component(c)
+            self._update_flags(self.detector.evaluate(tables, self.loader.filename))
+        return new
+
+    def _update_flags(self, failures):
+        for label, value in failures.items():
+            if label in ('File Name', 'Detection Duration') or pd.isnull(value):
+                continue
+            if self.flags.get(label) is True:
+                continue
+            self.flags[label] = bool(value)
+            if value and self.on_failure is not None:
+                self.on_failure(label, dict(self.flags))
+
+    def component(self, comp):
+        """returns all the rows of a component read so far
+
+        Returns
+        -------
+        dict
+            variable -> array
+        None
+            if the component was not read
+        """
+        table = self.tables.get(comp)
+        if table is None:
+            return None
+        return table.columns()
+
+    def follow(self, timeout=None):
+        """polls the file until stop is called or no line is appended for timeout seconds
+
+        Parameters
+        ----------
+        timeout : float
+            seconds without new lines after which following stops, never if None
+
+        Returns
+        -------
+        dict
+            failure flags detected
+        """
+        self._stop = False
+        last_change = time.time()
+        while not self._stop:
+            offset = self.offset
+            self.poll()
+            if self.offset != offset:
+                last_change = time.time()
+            elif timeout is not None and time.time() - last_change > timeout:
+                break
+            time.sleep(self.poll_interval)
+        return dict(self.flags)
+
+    def stop(self):
+        self._stop = True
+
+
+class GrowingTable():
+    '''
+    Columns of a component appended poll after poll, each column is a buffer
+    whose capacity doubles when it is full so an append only copies the new rows
+    '''
+    def __init__(self):
+        self.buffers = None # variable -> array, only the first nrows are used
+        self.nrows = 0
+
+    def append(self, cols):
+        """appends rows, the variables that are not in every append are dropped
+
+        Parameters
+        ----------
+        cols : dict
+            variable -> values of the new rows
+        """
+        cols = {k: column_values(v) for k, v in cols.items()}
+        n = len(next(iter(cols.values()))) if len(cols) > 0 else 0
+        if self.buffers is None:
+            self.buffers = {k: v[:0] for k, v in cols.items()}
+        self.buffers = {k: buf for k, buf in self.buffers.items() if k in cols}
+        for k, buf in self.buffers.items():
+            dtype = np.result_type(buf.dtype, cols[k].dtype)
+            if len(buf) < self.nrows + n or dtype != buf.dtype:
+                grown = np.empty(max(2 * len(buf), self.nrows + n), dtype=dtype)
+                grown[:self.nrows] = buf[:self.nrows]
+                buf = self.buffers[k] = grown
+            buf[self.nrows:self.nrows + n] = cols[k]
+        self.nrows += n
+
+    def columns(self):
+        """returns the rows appended so far, views of the buffers
+
+        Returns
+        -------
+        dict
+            variable -> array
+        """
+        return {k: buf[:self.nrows] for k, buf in self.buffers.items()}
+
+
+def column_values(values):
+    """returns the values of a column as an array, text or mixed values as objects
+    so nan is not turned into 'nan' and text never widens a numeric column
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind not in 'biuf':
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = list(values)
+    return arr
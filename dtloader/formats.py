@@ -0,0 +1,144 @@
+'''
+ArduPilot DataFlash format characters used in the FMT messages
+and their NumPy representation
+'''
+import numpy as np
+
+# format char -> (numpy dtype of the stored value, scale to apply on the stored value)
+FORMAT_TYPES = {'a': (np.dtype(('<i2', (32,))), None), # int16_t[32]
+                'b': (np.dtype('<i1'), None),
+                'B': (np.dtype('<u1'), None),
+                'h': (np.dtype('<i2'), None),
+                'H': (np.dtype('<u2'), None),
+                'i': (np.dtype('<i4'), None),
+                'I': (np.dtype('<u4'), None),
+                'q': (np.dtype('<i8'), None),
+                'Q': (np.dtype('<u8'), None),
+                'f': (np.dtype('<f4'), None),
+                'd': (np.dtype('<f8'), None),
+                'n': (np.dtype('S4'), None),
+                'N': (np.dtype('S16'), None),
+                'Z': (np.dtype('S64'), None),
+                'c': (np.dtype('<i2'), 0.01), # centi units
+                'C': (np.dtype('<u2'), 0.01),
+                'e': (np.dtype('<i4'), 0.01),
+                'E': (np.dtype('<u4'), 0.01),
+                'L': (np.dtype('<i4'), 1e-7), # latitude/longitude in degrees * 1e7
+                'M': (np.dtype('<u1'), None)} # flight mode
+
+# format char -> numpy dtype of the decoded (scaled) value
+DECODED_TYPES = {'b': np.dtype(np.int8),
+                 'B': np.dtype(np.uint8),
+                 'h': np.dtype(np.int16),
+                 'H': np.dtype(np.uint16),
+                 'i': np.dtype(np.int32),
+                 'I': np.dtype(np.uint32),
+                 'q': np.dtype(np.int64),
+                 'Q': np.dtype(np.uint64),
+                 'f': np.dtype(np.float32),
+                 'd': np.dtype(np.float64),
+                 'n': np.dtype('U4'),
+                 'N': np.dtype('U16'),
+                 'Z': np.dtype('U64'),
+                 'c': np.dtype(np.float32),
+                 'C': np.dtype(np.float32),
+                 'e': np.dtype(np.float32),
+                 'E': np.dtype(np.float32),
+                 'L': np.dtype(np.float64), # float32 is not precise enough for coordinates
+                 'M': np.dtype(np.uint8)}
+
+
+def record_dtype(fmt, labels, itemsize=None):
+    """creates the structured dtype of a message payload from its FMT format string
+
+    Parameters
+    ----------
+    fmt : str
+        format string e.g. 'QBIHBcLLeeEe'
+    labels : list
+        variable names, one per format char
+    itemsize : int
+        size of the payload, if larger than the packed fields the rest is padding
+
+    Returns
+    -------
+    numpy dtype
+    None
+        if the format has unknown chars or does not match the labels
+    """
+    if len(fmt) == 0 or len(fmt) != len(labels) or len(set(labels)) != len(labels):
+        return None
+    try:
+        formats = [FORMAT_TYPES[ch][0] for ch in fmt]
+    except KeyError:
+        return None
+    offsets = np.cumsum([0] + [f.itemsize for f in formats[:-1]]).tolist()
+    size = sum(f.itemsize for f in formats)
+    if itemsize is None:
+        itemsize = size
+    elif itemsize < size:
+        return None
+    return np.dtype({'names': labels, 'formats': formats,
+                     'offsets': offsets, 'itemsize': itemsize})
+
+
+def decode_column(values, ch):
+    """decodes the values of a column into the numpy type of its format char,
+    text values are expected to be already scaled as printed in the text logs
+
+    Parameters
+    ----------
+    values : list, series or array
+        values of the column, missing values as nan
+    ch : str
+        format char of the column
+
+    Returns
+    -------
+    array
+        decoded values, float64 if an integer column has missing or out of range values
+    None
+        if the format char is unknown or the values cannot be decoded
+    """
+    dtype = DECODED_TYPES.get(ch)
+    if dtype is None:
+        return None
+    if isinstance(values, np.ndarray) and values.dtype == dtype:
+        return values
+    if dtype.kind == 'U':
+        return np.array([v.strip() if isinstance(v, str) else '' for v in values], dtype=dtype)
+    try:
+        parsed = np.asarray(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        return None
+    if dtype.kind == 'f':
+        return parsed.astype(dtype)
+    info = np.iinfo(dtype)
+    if (np.isnan(parsed).any() or (parsed != np.round(parsed)).any()
+            or (parsed < info.min).any() or (parsed > info.max).any()):
+        return parsed
+    return parsed.astype(dtype)
+
+
+def text_values(values):
+    """values of a column that cannot be decoded, the text is stripped and the
+    numbers are parsed as floats so the values do not depend on how the log
+    was read (dataframe, stream chunks or cache)
+
+    Returns
+    -------
+    list
+        floats and strings
+    """
+    out = []
+    for v in values:
+        if isinstance(v, str):
+            v = v.strip()
+            try:
+                v = float(v)
+            except ValueError:
+                pass
+        elif isinstance(v, (int, float, np.number)):
+            v = float(v)
+        out.append(v)
+    return out
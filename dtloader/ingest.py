@@ -0,0 +1,208 @@
+'''
+Batch ingestion of a directory of log files,
+the logs are spread over a pool of worker processes each with its own dataloader
+'''
+import os
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from dtloader.dataloader import DataLoader
+from dtloader.manifest import IngestManifest
+from dtloader.logindex import INDEX_SUFFIX
+
+_loader = None # dataloader of the current worker process
+
+
+def _init_worker(cache_dir=None):
+    global _loader
+    _loader = DataLoader(cache_dir)
+
+
+def ingest_file(filepath, export=False, load_kwargs=None, loader=None, replace=False):
+    """loads a single log file and extracts its components
+
+    Parameters
+    ----------
+    filepath : str
+        path of the log file
+    export : bool
+        export the components to the database
+    load_kwargs : dict
+        extra arguments passed to DataLoader.load
+    loader : DataLoader
+        dataloader to use, the one of the worker process if None
+    replace : bool
+        the log was exported before and its collections are replaced
+
+    Returns
+    -------
+    dict
+        file name, load status, errors and variables recorded for the file,
+        components that could not be exported and duration
+    """
+    if loader is None:
+        if _loader is None:
+            _init_worker()
+        loader = _loader
+    # only keep what is recorded for this file
+    loader.errors_list = []
+    loader.var_list = []
+    loader.var_counts = Counter()
+    loader.export_status = {}
+    start_time = time.time()
+    try:
+        status = loader.load(filepath, **(load_kwargs or {}))
+        if status == 1:
+            loader.extractinfo(export=export, replace=replace)
+    except Exception as e:
+        print('Error ingesting file {} : {}'.format(filepath, e))
+        status = -6
+    return {'logname': os.path.basename(filepath),
+            'size MB': os.path.getsize(filepath) / 1e6 if os.path.exists(filepath) else 0,
+            'status': status,
+            'errors': list(loader.errors_list),
+            'var_list': list(loader.var_list),
+            'var_counts': loader.var_counts,
+            'export failures': [c for c, err in loader.export_status.items() if err is not None],
+            'duration s': time.time() - start_time}
+
+
+def _ingest_alone(filepath, export, load_kwargs, replace, cache_dir):
+    """ingests a file in its own worker process
+
+    Returns
+    -------
+    dict
+        same as ingest_file, with the status -6 if the worker died
+    """
+    with ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                             initargs=(cache_dir,)) as pool:
+        try:
+            return pool.submit(ingest_file, filepath, export, load_kwargs, None, replace).result()
+        except Exception as e:
+            print('Error ingesting file {} : worker process died {}'.format(filepath, e))
+            return {'logname': os.path.basename(filepath),
+                    'size MB': os.path.getsize(filepath) / 1e6 if os.path.exists(filepath) else 0,
+                    'status': -6,
+                    'errors': [],
+                    'var_list': [],
+                    'var_counts': Counter(),
+                    'export failures': [],
+                    'duration s': np.nan}
+
+
+def ingest_directory(dirpath, workers=None, max_inflight=None, export=False, loader=None,
+                     cache_dir=None, manifest=None, **load_kwargs):
+    """ingests all the log files of a directory using a pool of processes,
+    results are merged in the order of the files so they are the same as
+    running load and extractinfo on each file in a loop
+
+    Parameters
+    ----------
+    dirpath : str
+        directory containing the log files e.g. 'data'
+    workers : int
+        number of worker processes, all the cores if None, 1 runs the files serially
+    max_inflight : int
+        maximum number of files submitted to the pool at a time (default: 2 * workers)
+    export : bool
+        export the components of every log to the database
+    loader : DataLoader
+        if given the errors and variables of all the files are added to its
+        errors_list, var_list and var_counts so getcount can be used afterwards
+    cache_dir : str
+        directory of the parsed logs cache used by the workers
+    manifest : str
+        path of the manifest of ingested files, logs that did not change since
+        they were ingested are skipped, the other ones replace their collections
+    load_kwargs :
+        extra arguments passed to DataLoader.load e.g. stream=True
+
+    Returns
+    -------
+    dataframe
+        one row per file ['logname','size MB','status','errors','export failures','duration s','n variables']
+    """
+    files = [os.path.join(dirpath, f) for f in sorted(os.listdir(dirpath))
+             if not f.endswith(INDEX_SUFFIX)] # index files, if the cache is in the log directory
+    replace = [False] * len(files)
+    if manifest is not None:
+        manifest = IngestManifest(manifest)
+        checks = [manifest.check(f) for f in files]
+        print('{} of {} files unchanged, skipped'.format(checks.count(None), len(files)))
+        files = [f for f, ch in zip(files, checks) if ch is not None]
+        # every log may already have collections, e.g. changed and failed logs or the
+        # new ones of a database ingested before the manifest existed, they are replaced
+        # so a component is never stored twice
+        replace = [True] * len(files)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    results = [None] * len(files)
+
+    def finished(i, res):
+        results[i] = res
+        if manifest is not None: # saved after every file so a crash loses no progress
+            # logs with components that failed to export are ingested again next time
+            manifest.record(files[i], res['status'] == 1 and len(res['export failures']) == 0)
+            manifest.save()
+
+    if workers <= 1:
+        serial_loader = DataLoader(cache_dir) if loader is None else loader
+        saved = (serial_loader.errors_list, serial_loader.var_list, serial_loader.var_counts)
+        for i, f in enumerate(files):
+            finished(i, ingest_file(f, export, load_kwargs, serial_loader, replace[i]))
+        serial_loader.errors_list, serial_loader.var_list, serial_loader.var_counts = saved
+    else:
+        if max_inflight is None:
+            max_inflight = 2 * workers
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(cache_dir,))
+        try:
+            pending = {}
+            next_file = 0
+            while next_file < len(files) or len(pending) > 0:
+                broken = False
+                # keep a bounded number of files in flight
+                while next_file < len(files) and len(pending) < max_inflight:
+                    try:
+                        fut = pool.submit(ingest_file, files[next_file], export, load_kwargs,
+                                          None, replace[next_file])
+                    except BrokenProcessPool: # a worker died since the last wait
+                        broken = True
+                        break
+                    pending[fut] = next_file
+                    next_file += 1
+                if not broken:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        if fut.exception() is not None: # BrokenProcessPool, ingest_file catches the rest
+                            broken = True
+                            continue
+                        finished(pending.pop(fut), fut.result())
+                if broken:
+                    # a worker died (e.g. out of memory on a huge log) and took the pool down,
+                    # the files in flight are ingested again one at a time to find the one that crashed
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    for fut, i in pending.items():
+                        if fut.done() and not fut.cancelled() and fut.exception() is None:
+                            finished(i, fut.result()) # finished before the pool broke
+                        else:
+                            finished(i, _ingest_alone(files[i], export, load_kwargs, replace[i], cache_dir))
+                    pending = {}
+                    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                               initargs=(cache_dir,))
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    if loader is not None:
+        for res in results:
+            loader.errors_list += res['errors']
+            loader.var_list += res['var_list']
+            loader.merge_counts(res['var_counts'])
+    report = pd.DataFrame(results, columns=['logname', 'size MB', 'status', 'errors', 'export failures',
+                                           'var_list', 'duration s'])
+    report['n variables'] = report['var_list'].apply(len)
+    return report.drop('var_list', axis=1)
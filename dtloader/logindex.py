@@ -0,0 +1,147 @@
+'''
+Index of the byte offsets of the lines of every component of a text log,
+used to parse only the components that are needed
+'''
+import os
+import mmap
+import numpy as np
+from collections import OrderedDict
+
+INDEX_SUFFIX = '.idx.npz'
+MEMORY_INDEXES = 8 # number of indexes kept in memory when they are not saved
+
+_memory = OrderedDict() # log path -> LogIndex, most recently used last
+
+
+class LogIndex():
+    '''
+    Byte offset and line number of every line of each component of a text log
+    '''
+    def __init__(self, size=None, mtime=None):
+        self.size = size # size and modification time of the indexed file
+        self.mtime = mtime
+        self.offsets = {} # component -> array of byte offsets of its lines
+        self.lines = {} # component -> array of line numbers, blank lines excluded
+        self.nlines = 0
+
+    @classmethod
+    def build(cls, filepath):
+        """scans the log once and records the lines of every component
+
+        Returns
+        -------
+        LogIndex
+        """
+        st = os.stat(filepath)
+        index = cls(st.st_size, st.st_mtime)
+        offsets = {}
+        lines = {}
+        off = 0
+        with open(filepath, 'rb') as f:
+            for line in f:
+                if line.strip() != b'': # blank lines are not counted, as in the parser
+                    comp = line.split(b',', 1)[0].strip().decode('utf-8', 'replace')
+                    if comp not in offsets:
+                        offsets[comp] = []
+                        lines[comp] = []
+                    offsets[comp].append(off)
+                    lines[comp].append(index.nlines)
+                    index.nlines += 1
+                off += len(line)
+        for comp in offsets:
+            index.offsets[comp] = np.array(offsets[comp], dtype=np.int64)
+            index.lines[comp] = np.array(lines[comp], dtype=np.int64)
+        return index
+
+    @classmethod
+    def for_file(cls, filepath, index_dir=None):
+        """returns the index of a log, loaded from the index file if the log did not change
+        since it was indexed, built and saved otherwise
+
+        Parameters
+        ----------
+        filepath : str
+            path of the log
+        index_dir : str
+            directory of the index files, if None nothing is written (the logs may be
+            in a read only archive) and the last indexes built are kept in memory
+
+        Returns
+        -------
+        LogIndex
+        """
+        st = os.stat(filepath)
+        if index_dir is None:
+            key = os.path.abspath(filepath)
+            index = _memory.get(key)
+            if index is None or index.size != st.st_size or index.mtime != st.st_mtime:
+                index = cls.build(filepath)
+            _memory[key] = index
+            _memory.move_to_end(key)
+            while len(_memory) > MEMORY_INDEXES:
+                _memory.popitem(last=False)
+            return index
+        path = os.path.join(index_dir, os.path.basename(filepath) + INDEX_SUFFIX)
+        if os.path.exists(path):
+            index = cls.load(path)
+            if index.size == st.st_size and index.mtime == st.st_mtime:
+                return index
+        index = cls.build(filepath)
+        try:
+            index.save(path)
+        except OSError: # read only directory, the index is only kept in memory
+            pass
+        return index
+
+    def save(self, path):
+        arrays = {'meta': np.array([self.size, self.mtime, self.nlines], dtype=np.float64)}
+        for i, comp in enumerate(self.offsets):
+            arrays['name_{}'.format(i)] = np.array(comp)
+            arrays['off_{}'.format(i)] = self.offsets[comp]
+            arrays['line_{}'.format(i)] = self.lines[comp]
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            size, mtime, nlines = data['meta']
+            index = cls(int(size), mtime)
+            index.nlines = int(nlines)
+            i = 0
+            while 'name_{}'.format(i) in data:
+                comp = str(data['name_{}'.format(i)])
+                index.offsets[comp] = data['off_{}'.format(i)]
+                index.lines[comp] = data['line_{}'.format(i)]
+                i += 1
+        return index
+
+    def read_lines(self, filepath, components):
+        """reads the lines of the given components from the log
+
+        Parameters
+        ----------
+        filepath : str
+            path of the log
+        components : list
+            component names
+
+        Returns
+        -------
+        generator
+            (line, line number) in the order of the file
+        """
+        comps = [c for c in components if c in self.offsets]
+        if len(comps) == 0:
+            return
+        offsets = np.concatenate([self.offsets[c] for c in comps])
+        lines = np.concatenate([self.lines[c] for c in comps])
+        order = np.argsort(offsets, kind='stable')
+        with open(filepath, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for off, line_idx in zip(offsets[order].tolist(), lines[order].tolist()):
+                    end = mm.find(b'\n', off)
+                    if end == -1:
+                        end = len(mm)
+                    yield mm[off:end].decode('utf-8', 'replace'), line_idx
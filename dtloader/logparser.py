@@ -0,0 +1,255 @@
+'''
+Streaming parser for ArduPilot text logs,
+routes every line of the log into a buffer of its component where the
+fields are decoded chunk by chunk into typed numpy columns, so the text
+of the whole file is never held in memory
+'''
+import itertools
+import numpy as np
+from dtloader.formats import decode_column
+
+CHUNK_LINES = 100000 # number of lines read from the file per chunk
+FMT_LABELS = slice(5, 18) # position of the variable names in a FMT line
+
+
+def decode_fields(fields, ch=None):
+    """decodes the raw text fields of a column with its format char
+
+    Parameters
+    ----------
+    fields : list
+        stripped text fields, '' for the missing ones
+    ch : str
+        format char of the column, the fields are kept as text if None or not decodable
+
+    Returns
+    -------
+    array
+        typed values, missing values are nan (or '' for text formats)
+    """
+    values = [v if v != '' else np.nan for v in fields]
+    if ch is not None:
+        decoded = decode_column(values, ch)
+        if decoded is not None:
+            return decoded
+    return np.array(values, dtype=object)
+
+
+class ComponentBuffer():
+    '''
+    Column buffer of a single component, the rows are kept as text until
+    the buffer is flushed and then decoded into one typed segment per column
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.pending = [] # raw fields of the rows not decoded yet
+        self.pending_index = [] # line numbers of the rows not decoded yet
+        self.columns = [] # one list of decoded segments per column, an int for a run of missing rows
+        self.filled = [] # True for the columns with at least one value
+        self.line_index = [] # segments of the line number of every row in the log
+        self.nrows = 0 # number of rows decoded
+
+    def __len__(self):
+        return self.nrows + len(self.pending)
+
+    def append(self, fields, line_idx):
+        """append the fields of a line to the buffer
+
+        Parameters
+        ----------
+        fields : list
+            stripped fields of the line without the component name
+        line_idx : int
+            line number of the row in the log file
+        """
+        self.pending.append(fields)
+        self.pending_index.append(line_idx)
+
+    def flush(self, fmt=None):
+        """decodes the pending rows and releases their text
+
+        Parameters
+        ----------
+        fmt : str
+            format string of the component e.g. 'QBIHBcLLeeEe',
+            the columns are kept as text if None
+        """
+        if len(self.pending) == 0:
+            return
+        width = max(len(fields) for fields in self.pending)
+        # rows can be wider than the ones seen before, the new columns are missing before
+        while len(self.columns) < width:
+            self.columns.append([self.nrows] if self.nrows > 0 else [])
+            self.filled.append(False)
+        for i, col in enumerate(self.columns):
+            fields = [f[i] if i < len(f) else '' for f in self.pending]
+            if not self.filled[i] and any(v != '' for v in fields):
+                self.filled[i] = True
+            ch = fmt[i] if fmt is not None and i < len(fmt) else None
+            col.append(decode_fields(fields, ch))
+        self.line_index.append(np.array(self.pending_index, dtype=np.int64))
+        self.nrows += len(self.pending)
+        self.pending = []
+        self.pending_index = []
+
+    def column(self, i):
+        """returns all the decoded values of a column
+        """
+        segments = self.columns[i]
+        arrays = [seg for seg in segments if not isinstance(seg, int)]
+        text = len(arrays) > 0 and all(a.dtype.kind == 'U' for a in arrays)
+        parts = []
+        for seg in segments:
+            if isinstance(seg, int): # rows before the column appeared
+                parts.append(np.full(seg, '', dtype='U1') if text else np.full(seg, np.nan))
+            else:
+                parts.append(seg)
+        return np.concatenate(parts) if len(parts) > 0 else np.array([])
+
+    def nonempty_columns(self):
+        """returns the columns that have at least one value,
+        same as dropping the fully empty columns of the component dataframe
+        """
+        return [self.column(i) for i in range(len(self.columns)) if self.filled[i]]
+
+
+class LogParser():
+    '''
+    Reads a text log in chunks of lines and routes each line
+    to the buffer of its component, the FMT lines are kept as the schema.
+    The buffers are decoded after every chunk, at most a chunk of lines is held as text
+    '''
+    def __init__(self, chunksize=CHUNK_LINES, components=None):
+        """
+        chunksize : int
+            number of lines read per chunk
+        components : list
+            only buffer the lines of these components, all of them if None
+        """
+        self.chunksize = chunksize
+        self.selected = None if components is None else set(components)
+        self.fmt = {} # component -> fields of its FMT line
+        self.buffers = {} # component -> ComponentBuffer
+        self.nlines = 0 # number of non blank lines routed so far
+
+    def parse(self, fileobj):
+        """parse an opened text log chunk by chunk
+
+        Parameters
+        ----------
+        fileobj : file
+            text file object of the log
+        """
+        while True:
+            lines = list(itertools.islice(fileobj, self.chunksize))
+            if len(lines) == 0:
+                break
+            self.feed(lines)
+
+    def feed(self, lines):
+        """route a chunk of lines to the component buffers
+
+        Parameters
+        ----------
+        lines : list
+            list of raw lines of the log
+        """
+        for line in lines:
+            if self.route(line, self.nlines):
+                self.nlines += 1
+        self.flush()
+
+    def flush(self):
+        """decodes the rows buffered as text in all the components
+        """
+        for comp, buf in self.buffers.items():
+            buf.flush(self.format_string(comp))
+
+    def route(self, line, line_idx):
+        """route a single line to the buffer of its component
+
+        Parameters
+        ----------
+        line : str
+            raw line of the log
+        line_idx : int
+            line number of the line in the log, blank lines excluded
+
+        Returns
+        -------
+        bool
+            False if the line is blank
+        """
+        fields = [f.strip() for f in line.split(',')]
+        if len(fields) == 1 and fields[0] == '': # blank lines are not counted
+            return False
+        comp = fields[0]
+        if comp == 'FMT':
+            # the first definition of a component is the one used
+            if len(fields) > 3 and fields[3] not in self.fmt:
+                self.fmt[fields[3]] = fields
+        elif self.selected is None or comp in self.selected:
+            buf = self.buffers.get(comp)
+            if buf is None:
+                buf = self.buffers[comp] = ComponentBuffer(comp)
+            buf.append(fields[1:], line_idx)
+            if len(buf.pending) >= self.chunksize: # lines routed one by one
+                buf.flush(self.format_string(comp))
+        return True
+
+    @property
+    def components(self):
+        return list(self.buffers.keys())
+
+    def labels(self, comp):
+        """returns the variable names of a component from its FMT line
+
+        Returns
+        -------
+        list
+            variable names
+        None
+            if the component has no FMT line
+        """
+        fields = self.fmt.get(comp)
+        if fields is None:
+            return None
+        return [f for f in fields[FMT_LABELS] if f != '']
+
+    def format_string(self, comp):
+        """returns the format string of a component from its FMT line e.g. 'QBIHBcLLeeEe'
+        """
+        fields = self.fmt.get(comp)
+        if fields is None or len(fields) < 5:
+            return None
+        return fields[4]
+
+    def ncolumns(self, comp):
+        buf = self.buffers[comp]
+        buf.flush(self.format_string(comp))
+        return sum(buf.filled)
+
+    def columns(self, comp, names):
+        """returns the raw columns of a component with the given names,
+        the buffer is released afterwards to keep the memory bounded
+
+        Parameters
+        ----------
+        comp : str
+            component name
+        names : list
+            column names, one per non empty column
+
+        Returns
+        -------
+        dict
+            name -> array of values decoded with the format of the component,
+            including the lineIndex column, empty fields are returned as nan
+        """
+        buf = self.buffers.pop(comp)
+        buf.flush(self.format_string(comp))
+        cols = {}
+        for name, col in zip(names, buf.nonempty_columns()):
+            cols[name] = col
+        cols['lineIndex'] = np.concatenate(buf.line_index) if buf.nrows > 0 else np.array([], dtype=np.int64)
+        return cols
@@ -0,0 +1,71 @@
+'''
+Persistent manifest of the ingested log files,
+used by the ingestion driver to skip the logs that did not change
+'''
+import os
+import json
+from dtloader.cache import PARSER_VERSION, file_hash
+
+
+class IngestManifest():
+    '''
+    JSON file with one entry per ingested log:
+    path -> size, mtime, hash, parser version and status ('ok' or 'failed')
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)['files']
+
+    def check(self, filepath):
+        """checks if a log has to be ingested
+
+        Returns
+        -------
+        str
+            'new' if the log was never ingested, 'changed' if it was ingested
+            successfully but its content or the parser changed, 'failed' if the
+            last ingestion failed, None if the log can be skipped
+        """
+        entry = self.files.get(filepath)
+        if entry is None:
+            return 'new'
+        if entry['status'] != 'ok':
+            return 'failed'
+        if entry['parser_version'] != PARSER_VERSION:
+            return 'changed'
+        st = os.stat(filepath)
+        if st.st_size == entry['size'] and st.st_mtime == entry['mtime']:
+            return None
+        if st.st_size == entry['size'] and file_hash(filepath) == entry['hash']:
+            # touched but not modified
+            entry['mtime'] = st.st_mtime
+            return None
+        return 'changed'
+
+    def record(self, filepath, ok):
+        """records the result of the ingestion of a log
+
+        Parameters
+        ----------
+        filepath : str
+            path of the log
+        ok : bool
+            True if the log was ingested successfully
+        """
+        st = os.stat(filepath)
+        self.files[filepath] = {'size': st.st_size,
+                                'mtime': st.st_mtime,
+                                'hash': file_hash(filepath),
+                                'parser_version': PARSER_VERSION,
+                                'status': 'ok' if ok else 'failed'}
+
+    def save(self):
+        """writes the manifest, the previous file is replaced only once the new one is complete
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.files}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,173 @@
+'''
+Batch failure detection over many logs,
+the logs are spread over a pool of worker processes each with its own detector
+'''
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+module_path = os.path.abspath(os.path.join('..'))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+from failure_detector.failuredetector import FailureDetector
+from failure_detector.rules import select
+
+_detector = None # detector of the current worker process, with its own storage handle
+
+
+def _init_worker():
+    global _detector
+    _detector = FailureDetector()
+
+
+def detect_log(logname, detector=None, labels=None, first_occurrence=False):
+    """runs the failure detection on a single log
+
+    Parameters
+    ----------
+    logname : str
+        log file name as exported to the database (e.g. 'log1')
+    detector : FailureDetector
+        detector to use, the one of the worker process if None
+    labels : list
+        failures and incidents to detect, all of them if None
+    first_occurrence : bool
+        also report where each failure first occurred
+
+    Returns
+    -------
+    dict
+        row of the failure table, with an 'Error' message if the detection failed
+    """
+    if detector is None:
+        if _detector is None:
+            _init_worker()
+        detector = _detector
+    start_time = time.time()
+    try:
+        return detector.detect(logname, labels, first_occurrence)
+    except Exception as e:
+        print('Error detecting failures in log {} : {}'.format(logname, e))
+        return {'File Name': logname,
+                'Detection Duration': time.time() - start_time,
+                'Error': str(e)}
+
+
+def detect_batch(lognames, workers=None, max_inflight=None, detector=None, output=None,
+                 labels=None, first_occurrence=False, output_mode='w'):
+    """runs the failure detection on many logs, the rows are returned as soon
+    as the logs are done, in the order they finish
+
+    A log that fails does not stop the batch, its row has an 'Error' message.
+
+    Parameters
+    ----------
+    lognames : list
+        log file names as exported to the database
+    workers : int
+        number of worker processes, the number of cpus if None,
+        the logs are processed in this process if 1
+    max_inflight : int
+        maximum number of logs submitted to the pool at once, 2 * workers if None
+    detector : FailureDetector
+        detector used when workers is 1, a new one if None
+    output : str
+        .csv file or .parquet directory the rows are also streamed to
+    labels : list
+        failures and incidents to detect e.g. ['GPS Failure'], all of them if None,
+        only the variables of their rules are loaded
+    first_occurrence : bool
+        also report the lineIndex and time of the first sample violating each failure
+    output_mode : str
+        'w' to overwrite output, 'a' to append to the rows of a previous run
+
+    Returns
+    -------
+    generator
+        one dict per log, same keys as the rows of the failure table
+    """
+    lognames = list(lognames)
+    if labels is not None:
+        select(FailureDetector.RULES, labels) # unknown labels fail before any log is processed
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 and detector is None:
+        detector = FailureDetector()
+    writer = None
+    if output is not None:
+        writer = FailureDetector.table_writer(output, first_occurrence=first_occurrence,
+                                              mode=output_mode)
+    try:
+        for row in _detect_rows(lognames, workers, max_inflight, detector, labels, first_occurrence):
+            if writer is not None:
+                writer.write(row)
+            yield row
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _detect_rows(lognames, workers, max_inflight, detector, labels, first_occurrence):
+    if workers <= 1:
+        for logname in lognames:
+            yield detect_log(logname, detector, labels, first_occurrence)
+        return
+    if max_inflight is None:
+        max_inflight = 2 * workers
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    try:
+        pending = {}
+        next_log = 0
+        while next_log < len(lognames) or len(pending) > 0:
+            broken = False
+            # keep a bounded number of logs in flight
+            while next_log < len(lognames) and len(pending) < max_inflight:
+                try:
+                    fut = pool.submit(detect_log, lognames[next_log], None, labels, first_occurrence)
+                except BrokenProcessPool: # a worker died since the last wait
+                    broken = True
+                    break
+                pending[fut] = lognames[next_log]
+                next_log += 1
+            if not broken:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    logname = pending.pop(fut)
+                    try:
+                        yield fut.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        pending[fut] = logname
+                    except Exception as e:
+                        print('Error detecting failures in log {} : {}'.format(logname, e))
+                        yield {'File Name': logname, 'Error': str(e)}
+            if broken:
+                # a worker died (e.g. out of memory) and took the pool down, the logs in flight
+                # are run again one at a time to find the one that crashed
+                pool.shutdown(wait=True, cancel_futures=True)
+                for fut, logname in pending.items():
+                    if fut.done() and not fut.cancelled() and fut.exception() is None:
+                        yield fut.result() # finished before the pool broke
+                    else:
+                        yield _detect_alone(logname, labels, first_occurrence)
+                pending = {}
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _detect_alone(logname, labels, first_occurrence):
+    """runs the detection of a log in its own worker process
+
+    Returns
+    -------
+    dict
+        row of the failure table, with an 'Error' message if the worker died
+    """
+    with ProcessPoolExecutor(max_workers=1, initializer=_init_worker) as pool:
+        try:
+            return pool.submit(detect_log, logname, None, labels, first_occurrence).result()
+        except Exception as e:
+            print('Error detecting failures in log {} : {}'.format(logname, e))
+            return {'File Name': logname, 'Error': 'worker process died: {}'.format(e)}
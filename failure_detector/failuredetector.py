@@ -10,7 +10,9 @@ import sys
 module_path = os.path.abspath(os.path.join('..'))
 if module_path not in sys.path:
     sys.path.append(module_path)
-from db.database import DatabaseConnector
+from db.storage import get_connector
+from failure_detector.resultwriter import ResultWriter, FLUSH_ROWS
+from failure_detector.rules import RULES, dependencies, evaluate, select
 import time
 
 
@@ -20,35 +22,46 @@ class FailureDetector():
             in the components and report back the reason for that failure based
             on rule based conditions.
     '''
+    # rules labelling the failures and incidents, evaluated in order
+    RULES = RULES
+    # variables used by the detection rules, fetched together before running the rules
+    SIGNALS = dependencies(RULES)
+    # components used by the detection rules, only these need to be loaded
+    COMPONENTS = list(SIGNALS.keys())
+    # failures and incidents labelled for every log, one per rule
+    LABELS = [rule.label for rule in RULES]
+    # columns of the failure table, 'Error' is set for the logs that failed
+    TABLE_COLUMNS = ['File Name'] + LABELS + ['Detection Duration', 'Error']
+    # columns of the first occurrence of the failures, added in first occurrence mode
+    OCCURRENCE_COLUMNS = [label + col for label in LABELS for col in [' lineIndex', ' Time']]
+    # variables locating the samples of a component, loaded in first occurrence mode
+    POSITION_VARIABLES = ['lineIndex', 'TimeMS', 'TimeUS']
+
     def __init__(self):
         """init the failureDetector instance
 
         collection_list : list
             list of files
         """
-        # failures to add to the table
-        self.full_failure_table = pd.DataFrame() #rows to this table are appended using failures dict
+        # rows of the failure table, one failures dict per log
+        self.rows = []
+        self.writer = None # the rows are written to it instead of kept in rows when set
 
         self._reset_failures()
+        self.log_name = None
 
-        self.dbconnector = DatabaseConnector('vardb','27017')
+        self.dbconnector = get_connector('vardb') # backend chosen by DRONE_DB_BACKEND
+        self.tables = None # in memory components used instead of the database when set
+        self.signals = None # signals of the log fetched from the database, 'COMP_Var' -> array
 
     def _reset_failures(self):
-        self.failures = {'File Name': np.nan,
-                             'GPS Failure': np.nan ,
-                             'Mechanical Failure': np.nan,
-                              'Compass Interference': np.nan,
-                              'Acceleromer Failure': np.nan,
-                              'Uncontrolled latitude':np.nan,
-                              'Uncontrolled longitude':np.nan,
-                              'Uncontrolled altitude':np.nan,
-                              'Uncontrolled yaw': np.nan,
-                              'Uncontrolled pitch':np.nan,
-                              'Uncontrolled roll':np.nan,
-                              'Detection Duration':np.nan}
+        self.failures = {'File Name': np.nan}
+        self.failures.update({label: np.nan for label in self.LABELS})
+        self.failures['Detection Duration'] = np.nan
 
     def check_file_exist(self,comp):
-        """checks if component of a collection with the file name exist in the database
+        """checks if component of a collection with the file name exist in the database,
+        the collection is looked up in the catalog by the exact log and component names
 
         Parameters
         ----------
@@ -61,11 +74,7 @@ class FailureDetector():
             full file name
         -1 if not found
         """
-        self.collection_list = self.dbconnector.query_str(self.log_name)
-        for collname in self.collection_list:
-            if comp in collname:
-                return collname
-        return -1
+        return self.dbconnector.catalog.lookup(self.log_name, comp)
 
 
 
@@ -84,20 +93,42 @@ class FailureDetector():
             int
                 return -1 if column returning failed (keyerror)
             """
+            if self.tables is not None:
+                return self._load_table(comp,var)
+            if self.signals is not None:
+                return self._numeric(self.signals.get(comp+'_'+var, -1))
             f = self.check_file_exist(comp)
             if  f != -1:
-                res = self.dbconnector.query(f,var)
-                if res != -1:
-                    #check if it can be used as numeric
-                    try:
-                        res = pd.to_numeric(res)
-                        return np.array(res)
-                    except:
-                        return None
-                else:
-                    return None
-
-    def detectFailures(self,filename,summary=False):
+                return self._numeric(self.dbconnector.query(f,var))
+
+    def _numeric(self,res):
+        """converts the values of a variable to a numeric array
+
+        Returns
+        -------
+        array
+            values of the variable
+        None
+            if the values are not numeric or the variable was not found (-1)
+        """
+        if isinstance(res, np.ndarray) and res.dtype.kind in 'biuf': #packed numeric column
+            # same types as values read from lists, unsigned differences do not wrap around
+            if res.dtype.kind in 'iu':
+                return res.astype(np.int64)
+            if res.dtype.kind == 'f':
+                return res.astype(np.float64)
+            return res
+        if isinstance(res, np.ndarray) or res != -1:
+            #check if it can be used as numeric
+            try:
+                res = pd.to_numeric(res)
+                return np.array(res)
+            except:
+                return None
+        else:
+            return None
+
+    def detectFailures(self,filename,summary=False,labels=None,first_occurrence=False):
         """Loops through each file's variables and checks if a failure is detected
             using predefined rules
 
@@ -108,99 +139,238 @@ class FailureDetector():
             for a single log file
         filename : str
             log file name to add to the table
+        labels : list
+            failures and incidents to detect e.g. ['GPS Failure'], all of them if None.
+            Only the variables of their rules are loaded, the other labels are left NaN
+        first_occurrence : bool
+            also report the lineIndex and time (ms) of the first sample violating each failure,
+            in the '<label> lineIndex' and '<label> Time' columns
         """
-        self.log_name = filename
+        output_dict = self.detect(filename,labels,first_occurrence)
+        self.add_row(output_dict)
+        if summary:
+            print(output_dict)
+        print('Failure Detection Completed File --  {}'.format(self.log_name))
+        return output_dict
 
-        #load required variables for incident and failure detection
+    def detect(self,filename,labels=None,first_occurrence=False):
+        """runs the rules on the variables of a log stored in the database,
+        the result is returned without being added to the table
+
+        Parameters
+        ----------
+        filename : str
+            log file name
+        labels : list
+            failures and incidents to detect, all of them if None
+        first_occurrence : bool
+            also report where each failure first occurred
+
+        Returns
+        -------
+        dict
+            failures detected, file name and detection duration
+        """
+        self.log_name = filename
         start_time = time.time()
-        #ATT
-        att_desyaw = self.load('ATT','DesYaw')
-        att_yaw = self.load('ATT','Yaw')
-        att_despitch = self.load('ATT','DesPitch')
-        att_pitch = self.load('ATT','Pitch')
-        att_desroll = self.load('ATT','DesRoll')
-        att_roll = self.load('ATT','Roll')
-
-        #GPS
-        gps_nsats = self.load('GPS','NSats')
-        gps_ralt = self.load('GPS','RAlt')
-        gps_lng = self.load('GPS','Lng')
-        gps_lat = self.load('GPS','Lat')
-        gps_hdop = self.load('GPS','Hdop')
-
-        #ERR
-        err_ecode = self.load('ERR','ECode')
-        err_subsys = self.load('ERR','Subsys')
-
-        #CTUN
-        ctun_dalt = self.load('CTUN','DAlt')
-        ctun_alt = self.load('CTUN','Alt')
-        ctun_baralt = self.load('CTUN','BarAlt')
-
-        #CMD
-        cmd_lng = self.load('CMD','Lng')
-        cmd_lat = self.load('CMD','Lat')
-
-        #Baro
-        bar_alt = self.load('BARO','Alt')
-
-        #NTUN
-        ntun_dvelx = self.load('NTUN','DVelX')
-        ntun_velx = self.load('NTUN','VelX')
-        ntun_dvely = self.load('NTUN','DVelY')
-        ntun_vely = self.load('NTUN','VelY')
-
-        #MAG
-        mag_magx = self.load('MAG','MagX')
-        mag_magy = self.load('MAG','MagY')
-        mag_magz = self.load('MAG','MagZ')
-        mag_mofsx = self.load('MAG','MOfsX')
-        mag_mofsy = self.load('MAG','MOfsY')
-        mag_mofsz = self.load('MAG','MOfsZ')
-
-
-        #VIBE
-        vibe_vibex = self.load('VIBE','VibeX')
-        vibe_vibey = self.load('VIBE','VibeY')
-        vibe_vibez = self.load('VIBE','VibeZ')
-        vibe_clip0 = self.load('VIBE','Clip0')
-        vibe_clip1 = self.load('VIBE','Clip1')
-
-
-
-
-        #check incidenets
-        self.uc_pitch(att_despitch,att_pitch)
-        self.uc_roll(att_desroll,att_roll)
-        self.uc_yaw(att_desyaw,att_yaw)
-        self.uc_altitude(gps_ralt,bar_alt,ctun_baralt,ctun_alt,ctun_dalt)
-        self.uc_latitude(gps_lat,cmd_lat,ntun_dvelx,ntun_velx)
-        self.uc_longitude(cmd_lng,gps_lng,ntun_dvely,ntun_vely)
-
-
-
-        #Failures
-        #---------------------------------------------------
-        self.checkGPS(gps_nsats,gps_hdop,err_ecode,err_subsys)
-        self.checkMech(err_subsys,err_ecode)
-        self.checkACC(vibe_clip0,vibe_clip1,vibe_vibex,vibe_vibey,vibe_vibez,err_ecode,err_subsys)
-        self.checkCompass(mag_magx,mag_mofsx,mag_mofsy,mag_mofsz,mag_magy,mag_magz,err_ecode,err_subsys)
-
-        # update failure dataframe
-        self.failures['File Name'] = self.log_name
-        self.failures['Detection Duration'] = time.time() - start_time
-        #append to the full table of log files
-        self.full_failure_table = self.full_failure_table.append(self.failures,ignore_index=True)
-        if summary:
-            print(self.failures)
+        rules = self.rules(labels)
+        self._reset_failures() # labels left by the check methods
+        #the variables of the rules are fetched with one query per component
+        self.signals = self.dbconnector.fetch_signals(self.log_name, self._variables(rules, first_occurrence))
+        try:
+            self._run_rules(rules, first_occurrence)
+            # update failure dataframe
+            self.failures['File Name'] = self.log_name
+            self.failures['Detection Duration'] = time.time() - start_time
+            output_dict = self.failures.copy()
+        finally:
+            self.signals = None
+            self._reset_failures()
+        return output_dict
+
+    def evaluate(self,tables,name=None,labels=None,first_occurrence=False):
+        """runs the detection rules on components held in memory
+        instead of the ones exported to the database
+
+        Parameters
+        ----------
+        tables : dict
+            component -> dict of variable -> values, e.g. as extracted by the dataloader
+        name : str
+            log name used in the error messages
+        labels : list
+            failures and incidents to detect, all of them if None
+        first_occurrence : bool
+            also report where each failure first occurred
+
+        Returns
+        -------
+        dict
+            failures detected, same keys as the rows of the failure table
+        """
+        self.log_name = name
+        self.tables = tables
+        self._reset_failures() # labels left by the check methods
+        try:
+            self._run_rules(self.rules(labels), first_occurrence)
+        finally:
+            self.tables = None
         output_dict = self.failures.copy()
         self._reset_failures()
-        print('Failure Detection Completed File --  {}'.format(self.log_name))
         return output_dict
 
+    def rules(self,labels=None):
+        """returns the rules to run to detect some labels,
+        with the rules of the labels they depend on (e.g. uncontrolled yaw for mechanical failure)
+
+        Parameters
+        ----------
+        labels : list
+            failures and incidents to detect, all of them if None
+
+        Returns
+        -------
+        list
+            Rule instances
+        """
+        if labels is None:
+            return self.RULES
+        return select(self.RULES, labels)
+
+    def _variables(self,rules,first_occurrence=False):
+        """returns the variables to load for rules, component -> list of variables,
+        with the lineIndex and time of the components in first occurrence mode
+        """
+        variables = dependencies(rules)
+        if first_occurrence:
+            for comp in variables:
+                variables[comp] = variables[comp] + self.POSITION_VARIABLES
+        return variables
+
+    def _load_table(self,comp,var):
+        """loads a variable from the in memory components
+
+        Returns
+        -------
+        array
+            float values of the variable
+        None
+            if the component or variable does not exist or is not numeric
+        """
+        values = self.tables.get(comp, {}).get(var)
+        if values is None:
+            return None
+        try: # float values so differences of unsigned columns do not wrap around
+            return np.asarray(values, dtype=np.float64)
+        except (ValueError, TypeError):
+            return None
+
+    def _run_rules(self,rules=None,first_occurrence=False):
+        """loads the variables and runs the incident and failure rules, all of them if None,
+        in first occurrence mode the position of the first violating sample of each failure is added
+        """
+        if rules is None:
+            rules = self.RULES
+        #load the variables required by the rules only
+        signals = {}
+        for comp, variables in self._variables(rules, first_occurrence).items():
+            for var in variables:
+                signals[comp+'_'+var] = self.load(comp,var)
+        occurrences = {}
+        self.failures.update(evaluate(rules, signals, self.failures, self.log_name, occurrences))
+        if first_occurrence:
+            for rule in rules:
+                line, timems = occurrences.get(rule.label, (np.nan, np.nan))
+                self.failures[rule.label + ' lineIndex'] = line
+                self.failures[rule.label + ' Time'] = timems
+
+    def _apply(self,label,signals):
+        """runs the rule of a label on the given signals,
+        the label is only updated if the rule could decide it
+
+        Parameters
+        ----------
+        label : str
+            label of the rule e.g. 'Uncontrolled roll'
+        signals : dict
+            'COMP_Var' -> array, None for the signals not found
+
+        Returns
+        -------
+        True, False or NaN
+        """
+        rule = [r for r in self.RULES if r.label == label][0]
+        res = rule.evaluate(signals, self.failures, self.log_name)
+        if res is True or res is False:
+            self.failures[label] = res
+        return res
+
+    @property
+    def full_failure_table(self):
+        """dataframe of the rows kept in memory, the rows already streamed
+        to the writer are not in it
+        """
+        return pd.DataFrame(self.rows)
+
+    @full_failure_table.setter
+    def full_failure_table(self,df):
+        self.rows = df.to_dict('records')
+
+    def add_row(self,row):
+        """adds a row to the table, or to the writer when the table is streamed
+        """
+        if self.writer is not None:
+            self.writer.write(row)
+        else:
+            self.rows.append(row)
+
+    def stream_to(self,path,flush_rows=FLUSH_ROWS,first_occurrence=False,mode='w'):
+        """streams the rows of the table to a file instead of keeping them in memory,
+        the rows are written every flush_rows logs so a crash only loses the last ones
+
+        Parameters
+        ----------
+        path : str
+            .csv file or .parquet directory
+        flush_rows : int
+            number of rows buffered before they are written
+        first_occurrence : bool
+            add the columns of the first occurrence of the failures
+        mode : str
+            'w' to overwrite the file, 'a' to append to the rows of a previous run
+        """
+        self.writer = self.table_writer(path, flush_rows, first_occurrence, mode)
+        for row in self.rows:
+            self.writer.write(row)
+        self.rows = []
+
+    @classmethod
+    def table_writer(cls,path,flush_rows=FLUSH_ROWS,first_occurrence=False,mode='w'):
+        """returns a writer of failure table rows with the same schema for every batch
+        """
+        columns = list(cls.TABLE_COLUMNS)
+        dtypes = {label: 'boolean' for label in cls.LABELS}
+        dtypes.update({'File Name': 'string', 'Detection Duration': 'float64', 'Error': 'string'})
+        if first_occurrence:
+            columns += cls.OCCURRENCE_COLUMNS
+            dtypes.update({label + ' lineIndex': 'Int64' for label in cls.LABELS})
+            dtypes.update({label + ' Time': 'float64' for label in cls.LABELS})
+        return ResultWriter(path, columns, dtypes, flush_rows, mode)
+
+    def close_table(self):
+        """writes the buffered rows and stops streaming
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
     def export_table(self,path_exp = 'failure_data.csv'):
         """export failure detection tablt.
+        When the table is streamed the buffered rows are written to the writer instead.
         """
+        if self.writer is not None:
+            self.writer.flush()
+            return
         self.full_failure_table.to_csv(path_exp)
 
     def closeconn(self):
@@ -210,108 +380,32 @@ class FailureDetector():
 #----------------------------------------------------------------------------------------------
 
     def uc_roll(self,desroll,roll):
-        if desroll is None or roll is None:
-            return 1
-        try:
-            if self._checkLowerUpperBound(desroll,roll,60,absl=True):
-                self.failures['Uncontrolled roll'] = True
-
-            else:
-                self.failures['Uncontrolled roll'] = False
-        except:
-            print('Error occured in subtracting roll in file :', self.log_name)
-            return False
+        self._apply('Uncontrolled roll', {'ATT_DesRoll': desroll, 'ATT_Roll': roll})
         return 1
 
     def uc_pitch(self,despitch,pitch):
-        if despitch is None or pitch is None:
-            return 1
-        try:
-            if self._checkLowerUpperBound(despitch,pitch,60,absl=True):
-                self.failures['Uncontrolled pitch'] = True
-            else:
-                self.failures['Uncontrolled pitch'] = False
-        except:
-            print('Error occured in subtracting pitch in file :', self.log_name)
-            return False
+        self._apply('Uncontrolled pitch', {'ATT_DesPitch': despitch, 'ATT_Pitch': pitch})
         return 1
 
-
-
     def uc_yaw(self,desyaw,yaw):
-        if desyaw is None or yaw is None:
-            return 1
-        try:
-            if self._checkLowerUpperBound(desyaw,yaw,60,absl=True):
-                self.failures['Uncontrolled yaw'] = True
-            else:
-                self.failures['Uncontrolled yaw'] = False
-        except:
-            print('Error occured in subtracting raw in file :', self.log_name)
-            return False
+        self._apply('Uncontrolled yaw', {'ATT_DesYaw': desyaw, 'ATT_Yaw': yaw})
         return 1
 
-
     def uc_altitude(self,gps_ralt,bar_alt,ctun_baralt,ctun_alt,ctun_dalt):
-        if gps_ralt is not None:
-            if bar_alt is not None:
-                if self._checkLowerUpperBound(gps_ralt,bar_alt,5,absl=True):
-                        self.failures['Uncontrolled altitude'] = True
-                        return True
-                else:
-                        self.failures['Uncontrolled altitude'] = False
-            elif ctun_alt is not None:
-                            if self._checkLowerUpperBound(gps_ralt,ctun_alt,5,absl=True):
-                                self.failures['Uncontrolled altitude'] = True
-                                return True
-                            else:
-                                self.failures['Uncontrolled altitude'] = False
-
-        if ctun_dalt is not None and ctun_baralt is not None:
-                if len(abs(ctun_dalt - ctun_baralt) > 5) > 0 or len(abs(ctun_dalt - ctun_baralt) < -10) > 0 :
-                        self.failures['Uncontrolled altitude'] = True
-                else:
-                        self.failures['Uncontrolled altitude'] = False
-
+        signals = {'GPS_RAlt': gps_ralt, 'BARO_Alt': bar_alt, 'CTUN_BarAlt': ctun_baralt,
+                   'CTUN_Alt': ctun_alt, 'CTUN_DAlt': ctun_dalt}
+        if self._apply('Uncontrolled altitude', signals) is True:
+            return True
 
     def uc_latitude(self,gps_lat,cmd_lat,ntun_dvelx,ntun_velx):
-        if gps_lat is not None and cmd_lat is not None:
-            try: #shapes do not match
-                ch = self._gps_cmd_diff(gps_lat,cmd_lat)
-            except:
-                ch = None
-            if ch:
-                self.failures['Uncontrolled latitude'] = True
-                return True #return true regardless of the second Rule
-            elif ch == False:
-                self.failures['Uncontrolled latitude'] = False
-
-        if ntun_velx is not None and ntun_dvelx is not None:
-            if self._checkLowerUpperBound(ntun_velx,ntun_dvelx,100,absl=True):
-                self.failures['Uncontrolled latitude'] = True
-                return True
-            else:
-                self.failures['Uncontrolled latitude'] = False
-
+        signals = {'GPS_Lat': gps_lat, 'CMD_Lat': cmd_lat, 'NTUN_DVelX': ntun_dvelx, 'NTUN_VelX': ntun_velx}
+        if self._apply('Uncontrolled latitude', signals) is True:
+            return True
 
     def uc_longitude(self,cmd_lng,gps_lng,ntun_dvely,ntun_vely):
-        if cmd_lng is not None and gps_lng is not None:
-            try: #shapes do not match
-                ch = self._gps_cmd_diff(gps_lng,cmd_lng)
-            except:
-                ch = None
-            if ch:
-                self.failures['Uncontrolled longitude'] = True
-                return True
-            elif ch == False:
-                self.failures['Uncontrolled longitude'] = False
-
-        if ntun_vely is not None and ntun_dvely is not None:
-            if self._checkLowerUpperBound(ntun_vely,ntun_dvely,100,absl=True):
-                self.failures['Uncontrolled longitude'] = True
-                return True
-            else:
-                self.failures['Uncontrolled longitude'] = False
+        signals = {'CMD_Lng': cmd_lng, 'GPS_Lng': gps_lng, 'NTUN_DVelY': ntun_dvely, 'NTUN_VelY': ntun_vely}
+        if self._apply('Uncontrolled longitude', signals) is True:
+            return True
 #-------------------------------------------------------------------------------------------------------------
 ###              FAILURES
 #----------------------------------------------------------------------------------------------
@@ -324,129 +418,25 @@ class FailureDetector():
         err_ecode : list
         err_subsys : list
         """
-
-        if gps_nsats is not None:
-            if sum(gps_nsats < 10 ) > 0:
-                self.failures['GPS Failure'] = True
-                return True
-            else:
-                self.failures['GPS Failure'] = False
-
-        if gps_hdop is not None:
-            if sum(gps_hdop>2) > 0:
-                self.failures['GPS Failure'] = True
-                return True
-            else:
-                self.failures['GPS Failure'] = False
-
-        self._checkerrcode('GPS Failure',err_ecode,err_subsys,2,11)
-
+        signals = {'GPS_NSats': gps_nsats, 'GPS_Hdop': gps_hdop, 'ERR_ECode': err_ecode, 'ERR_Subsys': err_subsys}
+        if self._apply('GPS Failure', signals) is True:
+            return True
 
     def checkMech(self,err_subsys,err_ecode):
-        #check if we have Uncontrolled Yaw,Roll or pitch
-        ucyaw = self.failures['Uncontrolled yaw']
-        ucroll = self.failures['Uncontrolled roll']
-        ucpitch = self.failures['Uncontrolled pitch']
-
-        if ucyaw or ucroll or ucpitch:
-            self.failures['Mechanical Failure'] = True
+        #uncontrolled yaw, roll or pitch are read from the failures already detected
+        if self._apply('Mechanical Failure', {'ERR_Subsys': err_subsys, 'ERR_ECode': err_ecode}) is True:
             return True
 
-        self._checkerrcode('Mechanical Failure',err_ecode,err_subsys,ecode_val=1,subsys_val=12)
-        self._checkerrcode('Mechanical Failure',err_ecode,err_subsys,ecode_val=2,subsys_val=12)
-        self._checkerrcode('Mechanical Failure',err_ecode,err_subsys,ecode_val=2,subsys_val=15)
-
-
-
     def checkACC(self,vibe_clip0,vibe_clip1,vibe_vibex,vibe_vibey,vibe_vibez,err_ecode,err_subsys):
-        vbx = self._checkvibe(vibe_vibex)
-        vby = self._checkvibe(vibe_vibey)
-        vbz = self._checkvibe(vibe_vibez)
-
-        if  vbx or  vby or vbz:
-                self.failures['Acceleromer Failure'] = True
-                return True
-
-        elif vbx == False or vby == False or vbz == False:
-                self.failures['Acceleromer Failure'] = False
-
-        if vibe_clip0 is not None and vibe_clip0 is not None:
-            if sum(abs(vibe_clip0 - vibe_clip1) > 200) > 0:
-                    self.failures['Acceleromer Failure'] = True
-                    return True
-            else:
-                self.failures['Acceleromer Failure'] = False
-
-        self._checkerrcode('Acceleromer Failure',err_ecode,err_subsys,ecode_val=2,subsys_val=16)
-        self._checkerrcode('Acceleromer Failure',err_ecode,err_subsys,ecode_val=1,subsys_val=17)
-
+        signals = {'VIBE_Clip0': vibe_clip0, 'VIBE_Clip1': vibe_clip1, 'VIBE_VibeX': vibe_vibex,
+                   'VIBE_VibeY': vibe_vibey, 'VIBE_VibeZ': vibe_vibez,
+                   'ERR_ECode': err_ecode, 'ERR_Subsys': err_subsys}
+        if self._apply('Acceleromer Failure', signals) is True:
+            return True
 
     def checkCompass(self,mag_magx,mag_mofsx,mag_mofsy,mag_mofsz,mag_magy,mag_magz,err_ecode,err_subsys):
-            mgx = self._checkmag(mag_magx,mag_mofsx)
-            mgy = self._checkmag(mag_magy,mag_mofsy)
-            mgz = self._checkmag(mag_magz,mag_mofsz)
-
-            if mgx or mgy or mgz:
-                self.failures['Compass Interference'] = True
-                return True
-
-            elif mgx == False or mgy == False or mgz == False:
-                self.failures['Compass Interference'] = False
-
-            self._checkerrcode('Compass Interference',err_ecode,err_subsys,ecode_val=2,subsys_val=16)
-            self._checkerrcode('Compass Interference',err_ecode,err_subsys,ecode_val=1,subsys_val=17)
-
-    def _gps_cmd_diff(self,gps,cmd):
-        #get nonzero cmd entries
-        cmd_clean = cmd[cmd.nonzero()]
-        rg = min(len(gps),len(cmd_clean))
-        for i in range(rg):
-            if (abs(gps[i]) - abs(cmd_clean[i])) > 5:
-                return True
-        return False
-
-    def _checkLowerUpperBound(self,l1,l2,upperb,lowerb=None,sub=True,absl=False):
-        if absl:
-            if len(l1) != len(l2):
-                rg = min(len(l1),len(l2))
-                for i in range(rg):
-                    return abs(l1[i]) - abs(l2[i]) > upperb
-                return False
-
-            else:
-                return sum(abs(l1 - l2) > upperb) > 0
-        else:
-            if sub:
-                sub = l1 - l2
-                sub2 = l2 -l1
-            else:
-                sub = l1 + l2
-                sub2 = l1 + l2
-                if sum(sub > upperb) > 0 and sum(sub2 < lowerb) > 0 :
-                    return True
-            return False
-
-    def _checkmag(self,mag,mofs):
-        if mag is not None and mofs is not None:
-            if sum(abs(mag - mofs) > 300) > 0:
-                    return True
-            else:
-                return False
-        else:
-            return None
-
-#Supporting Methods
-    def _checkvibe(self,vibe):
-        if vibe is not None:
-            if  sum(vibe > 60) > 0 :
-                    return True
-            else:
-                return False
-        else:
-            return None
-
-    def _checkerrcode(self,dict_keyname,err_ecode,err_subsys,ecode_val,subsys_val):
-        if err_subsys is not None and err_ecode is not None:
-                    for i in range(len(err_ecode)):
-                        if (err_subsys[i] ==subsys_val ) and (err_ecode[i] == ecode_val):
-                            self.failures[dict_keyname] = True
+        signals = {'MAG_MagX': mag_magx, 'MAG_MOfsX': mag_mofsx, 'MAG_MagY': mag_magy,
+                   'MAG_MOfsY': mag_mofsy, 'MAG_MagZ': mag_magz, 'MAG_MOfsZ': mag_mofsz,
+                   'ERR_ECode': err_ecode, 'ERR_Subsys': err_subsys}
+        if self._apply('Compass Interference', signals) is True:
+            return True
@@ -0,0 +1,95 @@
+'''
+Streaming writer of the failure table,
+the rows are buffered and written in batches so the table is never held
+in memory and the rows already written survive a crash
+'''
+import os
+import pandas as pd
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # parquet output is not supported without pyarrow
+    pyarrow = None
+
+FLUSH_ROWS = 100 # number of rows buffered before they are written
+
+
+class ResultWriter():
+    '''
+    Writes rows to a CSV file, or to a directory of Parquet part files
+    (one file per batch, readable with pd.read_parquet) if the path ends with .parquet.
+    Both are either overwritten or appended to, depending on the mode
+    '''
+    def __init__(self, path, columns, dtypes=None, flush_rows=FLUSH_ROWS, mode='w'):
+        """
+        path : str
+            output file, e.g. 'failure_data.csv' or 'failure_data.parquet'
+        columns : list
+            columns of the table, keys of the rows that are not in columns are ignored
+        dtypes : dict
+            column -> pandas dtype, gives the same schema to every batch
+        flush_rows : int
+            number of rows buffered before they are written
+        mode : str
+            'w' to overwrite the rows of a previous run, 'a' to append to them
+            e.g. when restarting after a crash
+        """
+        if mode not in ('w', 'a'):
+            raise ValueError("mode must be 'w' or 'a', not {}".format(mode))
+        self.path = path
+        self.columns = list(columns)
+        self.dtypes = dtypes or {}
+        self.flush_rows = flush_rows
+        self.rows = []
+        self.parquet = path.lower().endswith('.parquet')
+        if self.parquet:
+            if pyarrow is None:
+                raise ImportError('pyarrow is required to write parquet files')
+            os.makedirs(path, exist_ok=True)
+            parts = [f for f in os.listdir(path) if f.startswith('part-')]
+            if mode == 'w':
+                for f in parts:
+                    os.remove(os.path.join(path, f))
+                parts = []
+            # unfinished parts (.tmp) of a crashed run are overwritten
+            self.nparts = len([f for f in parts if f.endswith('.parquet')])
+        else:
+            if mode == 'w' or not os.path.exists(path):
+                open(path, 'w').close()
+            # the header is only written with the first batch of an empty file
+            self.header = os.path.getsize(path) == 0
+        self.nwritten = 0
+
+    def write(self, row):
+        """adds a row, the buffered rows are written once there are flush_rows of them
+
+        Parameters
+        ----------
+        row : dict
+            column -> value
+        """
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+        df = pd.DataFrame(self.rows, columns=self.columns).astype(self.dtypes)
+        if self.parquet:
+            # written to a temporary file first so a crash never leaves a broken part
+            part = os.path.join(self.path, 'part-{:05d}.parquet'.format(self.nparts))
+            df.to_parquet(part + '.tmp', engine='pyarrow', index=False)
+            os.replace(part + '.tmp', part)
+            self.nparts += 1
+        else:
+            with open(self.path, 'a', newline='') as f:
+                df.to_csv(f, header=self.header, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            self.header = False
+        self.nwritten += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
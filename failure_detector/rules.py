@@ -0,0 +1,432 @@
+'''
+Declarative failure and incident rules,
+a rule labels a log from a list of checks on its signals, every check is
+evaluated on whole arrays as a numpy mask of the samples violating it
+'''
+import numpy as np
+
+# comparisons of the checks, expression <op> threshold
+OPERATORS = {'>': np.greater,
+             '>=': np.greater_equal,
+             '<': np.less,
+             '<=': np.less_equal,
+             '==': np.equal}
+
+
+#Expressions of the checks
+def value(a):
+    """values of a single signal
+    """
+    return a
+
+
+def absdiff(a, b):
+    """absolute difference of two signals,
+    over the samples they have in common if their lengths differ
+    """
+    n = min(len(a), len(b))
+    return np.abs(a[:n] - b[:n])
+
+
+def nonzero_offset(a, b):
+    """difference of the magnitudes of a signal and of the nonzero values of a target,
+    e.g. the GPS position and the commanded position
+    """
+    b = b[b != 0]
+    n = min(len(a), len(b))
+    return np.abs(a[:n]) - np.abs(b[:n])
+
+
+def first_index(mask):
+    """returns the position of the first True of a mask, -1 if there is none
+    """
+    if len(mask) == 0:
+        return -1
+    i = int(np.argmax(mask)) # argmax stops at the first True
+    return i if mask[i] else -1
+
+
+def occurrence(signals, comp, i):
+    """returns the lineIndex and the time in ms of a sample of a component,
+    NaN if they were not loaded
+    """
+    line = signals.get(comp+'_lineIndex')
+    line = int(line[i]) if line is not None and i < len(line) else np.nan
+    timems = signals.get(comp+'_TimeMS')
+    timeus = signals.get(comp+'_TimeUS')
+    if timems is not None and i < len(timems):
+        return line, float(timems[i])
+    if timeus is not None and i < len(timeus):
+        return line, timeus[i] / 1000.0
+    return line, np.nan
+
+
+class Check():
+    '''
+    Condition on the signals of a log, violated on the samples where
+    expr(*signals) <op> threshold
+    '''
+    def __init__(self, signals, op, threshold, expr=value, only_true=False):
+        """
+        signals : list
+            signals given to expr, 'COMP_Var' e.g. ['ATT_DesRoll', 'ATT_Roll']
+        op : str
+            comparison, one of OPERATORS
+        threshold : float
+            value compared to the expression
+        expr : function
+            vectorized expression of the signals, the values of the first one by default
+        only_true : bool
+            the check can only set the label to True,
+            a check that is not violated does not clear the label
+        """
+        self.signals = list(signals)
+        self.op = op
+        self.threshold = threshold
+        self.expr = expr
+        self.only_true = only_true
+
+    def mask(self, signals):
+        """returns the samples violating the check
+
+        Parameters
+        ----------
+        signals : dict
+            'COMP_Var' -> array, None for the signals not found
+
+        Returns
+        -------
+        array
+            boolean mask
+        None
+            if a signal is missing
+        """
+        values = [signals.get(name) for name in self.signals]
+        if any(v is None for v in values):
+            return None
+        return OPERATORS[self.op](self.expr(*values), self.threshold)
+
+    def evaluate(self, signals, labels):
+        """returns True if the check is violated, False if not, NaN if it can not be decided
+        """
+        return self.locate(signals, labels, {})[0]
+
+    def locate(self, signals, labels, occurrences):
+        """evaluates the check and finds its first violating sample
+
+        Parameters
+        ----------
+        signals : dict
+            'COMP_Var' -> array, None for the signals not found
+        labels : dict
+            labels of the rules evaluated before
+        occurrences : dict
+            label -> (lineIndex, time) of the rules evaluated before
+
+        Returns
+        -------
+        tuple
+            (True, False or NaN, (lineIndex, time) of the first violating sample or None)
+        """
+        mask = self.mask(signals)
+        if mask is None:
+            return np.nan, None
+        i = first_index(mask)
+        if i >= 0: # sample of the component of the first signal
+            return True, occurrence(signals, self.signals[0].split('_', 1)[0], i)
+        return (np.nan if self.only_true else False), None
+
+
+class FirstAvailable(Check):
+    '''
+    Evaluates the first of its checks whose signals are all found
+    '''
+    def __init__(self, checks):
+        self.checks = list(checks)
+        self.signals = []
+        for check in self.checks:
+            self.signals += [s for s in check.signals if s not in self.signals]
+
+    def mask(self, signals):
+        for check in self.checks:
+            if all(signals.get(name) is not None for name in check.signals):
+                return check.mask(signals)
+        return None
+
+    def locate(self, signals, labels, occurrences):
+        for check in self.checks:
+            if all(signals.get(name) is not None for name in check.signals):
+                return check.locate(signals, labels, occurrences)
+        return np.nan, None
+
+
+class ErrCode(Check):
+    '''
+    Violated by the ERR messages of a subsystem with an error code,
+    the absence of the error does not clear the label
+    '''
+    def __init__(self, subsys, ecode):
+        """
+        subsys : int
+            ERR Subsys value
+        ecode : int
+            ERR ECode value
+        """
+        self.subsys = subsys
+        self.ecode = ecode
+        Check.__init__(self, ['ERR_Subsys', 'ERR_ECode'], '==', True, only_true=True)
+
+    def mask(self, signals):
+        subsys = signals.get('ERR_Subsys')
+        ecode = signals.get('ERR_ECode')
+        if subsys is None or ecode is None:
+            return None
+        n = min(len(subsys), len(ecode))
+        return (subsys[:n] == self.subsys) & (ecode[:n] == self.ecode)
+
+
+class Label(Check):
+    '''
+    Violated if one of the labels set by earlier rules is True,
+    e.g. an uncontrolled attitude for a mechanical failure
+    '''
+    def __init__(self, labels):
+        """
+        labels : list
+            labels of the rules it depends on, evaluated before it
+        """
+        self.labels = list(labels)
+        Check.__init__(self, [], '==', True, only_true=True)
+
+    def mask(self, signals):
+        return None
+
+    def locate(self, signals, labels, occurrences):
+        # NaN is truthy, only the labels that are True count
+        found = [label for label in self.labels if labels.get(label) == True]
+        if len(found) == 0:
+            return np.nan, None
+        # earliest occurrence of the labels
+        located = [occurrences[label] for label in found if label in occurrences]
+        located = [o for o in located if not np.isnan(o[0])]
+        return True, min(located) if len(located) > 0 else (np.nan, np.nan)
+
+
+class Rule():
+    '''
+    Label of a failure or incident from its checks:
+    True if a check is violated, False if no check is violated and one of them
+    could be decided, NaN if none could be decided (e.g. missing signals)
+    '''
+    def __init__(self, label, checks):
+        """
+        label : str
+            column of the failure table, e.g. 'GPS Failure'
+        checks : list
+            Check instances, evaluated in order until one is violated
+        """
+        self.label = label
+        self.checks = list(checks)
+
+    @property
+    def signals(self):
+        """signals used by the checks of the rule, 'COMP_Var'
+        """
+        signals = []
+        for check in self.checks:
+            signals += [s for s in check.signals if s not in signals]
+        return signals
+
+    @property
+    def requires(self):
+        """labels of the rules it depends on
+        """
+        return [label for check in self.checks if isinstance(check, Label) for label in check.labels]
+
+    def evaluate(self, signals, labels, name=None):
+        """returns the label of the log
+
+        Parameters
+        ----------
+        signals : dict
+            'COMP_Var' -> array, None for the signals not found
+        labels : dict
+            labels of the rules evaluated before
+        name : str
+            log name used in the error messages
+
+        Returns
+        -------
+        True, False or NaN
+        """
+        return self.locate(signals, labels, {}, name)[0]
+
+    def locate(self, signals, labels, occurrences, name=None):
+        """returns the label of the log and where it was first violated,
+        the checks after the first violated one are not evaluated
+
+        Returns
+        -------
+        tuple
+            (True, False or NaN, (lineIndex, time) of the first violating sample
+            of the first violated check or None)
+        """
+        result = np.nan
+        for check in self.checks:
+            try:
+                res, found = check.locate(signals, labels, occurrences)
+            except Exception as e:
+                print('Error occured in rule {} in file : {} ({})'.format(self.label, name, e))
+                continue
+            if res is True:
+                return True, found
+            if res is False:
+                result = False
+        return result, None
+
+
+#Rules of the failure detector, the incidents come first as failures depend on them
+RULES = [
+    Rule('Uncontrolled pitch', [Check(['ATT_DesPitch', 'ATT_Pitch'], '>', 60, absdiff)]),
+    Rule('Uncontrolled roll', [Check(['ATT_DesRoll', 'ATT_Roll'], '>', 60, absdiff)]),
+    Rule('Uncontrolled yaw', [Check(['ATT_DesYaw', 'ATT_Yaw'], '>', 60, absdiff)]),
+    Rule('Uncontrolled altitude', [FirstAvailable([Check(['GPS_RAlt', 'BARO_Alt'], '>', 5, absdiff),
+                                                   Check(['GPS_RAlt', 'CTUN_Alt'], '>', 5, absdiff)]),
+                                   Check(['CTUN_DAlt', 'CTUN_BarAlt'], '>', 5, absdiff)]),
+    Rule('Uncontrolled latitude', [Check(['GPS_Lat', 'CMD_Lat'], '>', 5, nonzero_offset),
+                                   Check(['NTUN_VelX', 'NTUN_DVelX'], '>', 100, absdiff)]),
+    Rule('Uncontrolled longitude', [Check(['GPS_Lng', 'CMD_Lng'], '>', 5, nonzero_offset),
+                                    Check(['NTUN_VelY', 'NTUN_DVelY'], '>', 100, absdiff)]),
+    Rule('GPS Failure', [Check(['GPS_NSats'], '<', 10),
+                         Check(['GPS_Hdop'], '>', 2),
+                         ErrCode(subsys=11, ecode=2)]),
+    Rule('Mechanical Failure', [Label(['Uncontrolled yaw', 'Uncontrolled roll', 'Uncontrolled pitch']),
+                                ErrCode(subsys=12, ecode=1),
+                                ErrCode(subsys=12, ecode=2),
+                                ErrCode(subsys=15, ecode=2)]),
+    Rule('Acceleromer Failure', [Check(['VIBE_VibeX'], '>', 60),
+                                 Check(['VIBE_VibeY'], '>', 60),
+                                 Check(['VIBE_VibeZ'], '>', 60),
+                                 Check(['VIBE_Clip0', 'VIBE_Clip1'], '>', 200, absdiff),
+                                 ErrCode(subsys=16, ecode=2),
+                                 ErrCode(subsys=17, ecode=1)]),
+    Rule('Compass Interference', [Check(['MAG_MagX', 'MAG_MOfsX'], '>', 300, absdiff),
+                                  Check(['MAG_MagY', 'MAG_MOfsY'], '>', 300, absdiff),
+                                  Check(['MAG_MagZ', 'MAG_MOfsZ'], '>', 300, absdiff),
+                                  ErrCode(subsys=16, ecode=2),
+                                  ErrCode(subsys=17, ecode=1)])]
+
+
+def select(rules, labels):
+    """returns the rules to evaluate to get some labels,
+    with the rules of the labels they depend on
+
+    Parameters
+    ----------
+    rules : list
+        Rule instances
+    labels : list
+        labels wanted, e.g. ['GPS Failure']
+
+    Returns
+    -------
+    list
+        rules in the same order as in rules
+    """
+    by_label = {rule.label: rule for rule in rules}
+    needed = set()
+    todo = list(labels)
+    while len(todo) > 0:
+        label = todo.pop()
+        if label not in by_label:
+            raise ValueError('no rule for the label {}'.format(label))
+        if label not in needed:
+            needed.add(label)
+            todo += by_label[label].requires
+    return [rule for rule in rules if rule.label in needed]
+
+
+def dependencies(rules):
+    """returns the variables to load to evaluate rules
+
+    Parameters
+    ----------
+    rules : list
+        Rule instances
+
+    Returns
+    -------
+    dict
+        component -> list of variables, e.g. {'ATT': ['DesPitch', 'Pitch'], ...}
+    """
+    signals = {}
+    for rule in rules:
+        for name in rule.signals:
+            comp, var = name.split('_', 1)
+            variables = signals.setdefault(comp, [])
+            if var not in variables:
+                variables.append(var)
+    return signals
+
+
+def paired_components(rules):
+    """returns the components whose signals are compared sample by sample
+    with the signals of another component, e.g. GPS and BARO for the altitude
+
+    Parameters
+    ----------
+    rules : list
+        Rule instances
+
+    Returns
+    -------
+    set
+        component names
+    """
+    components = set()
+    for rule in rules:
+        checks = list(rule.checks)
+        while len(checks) > 0:
+            check = checks.pop()
+            if isinstance(check, FirstAvailable):
+                checks += check.checks
+                continue
+            comps = set(name.split('_', 1)[0] for name in check.signals)
+            if len(comps) > 1:
+                components |= comps
+    return components
+
+
+def evaluate(rules, signals, labels=None, name=None, occurrences=None):
+    """evaluates rules in order on the signals of a log
+
+    Parameters
+    ----------
+    rules : list
+        Rule instances, a rule depending on labels comes after their rules
+    signals : dict
+        'COMP_Var' -> array, None for the signals not found
+    labels : dict
+        labels already known, e.g. the failures of the detector
+    name : str
+        log name used in the error messages
+    occurrences : dict
+        filled with label -> (lineIndex, time in ms) of the first violating sample
+        for the labels that are True, e.g. the event position of an uncontrolled yaw.
+        NaN if the lineIndex and TimeMS/TimeUS of the component are not in signals
+
+    Returns
+    -------
+    dict
+        label -> True, False or NaN for each rule
+    """
+    labels = dict(labels or {})
+    if occurrences is None:
+        occurrences = {}
+    results = {}
+    for rule in rules:
+        res, found = rule.locate(signals, labels, occurrences, name)
+        results[rule.label] = labels[rule.label] = res
+        if found is not None:
+            occurrences[rule.label] = found
+    return results
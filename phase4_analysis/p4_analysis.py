@@ -19,6 +19,7 @@ from dtloader.dataloader import DataLoader
 from utils.utils import *
 from utils.features_eng import *
 from segmentation.segmentation import Segmentation
+from failure_detector.rules import first_index
 from scipy.stats import ttest_ind
 from statsmodels.tsa.stattools import grangercausalitytests
 
@@ -152,10 +153,10 @@ def get_yaw_event(file_detect,dt,unwrap_thresh=280,undes_thresh=70):
     df['Yaw'] = np.unwrap(df['Yaw'],280)
     df['DesYaw'] = np.unwrap(df['DesYaw'],280)
     bool_res = abs(df['Yaw'] - df['DesYaw']) > undes_thresh #Detection RULE
-    for i,b in enumerate(bool_res):
-        if b == True:
-            line_idx_pos = df.iloc[i,-1] #line index number of when the event started
-            return df,line_idx_pos
+    i = first_index(bool_res.values)
+    if i >= 0:
+        line_idx_pos = df.iloc[i,-1] #line index number of when the event started
+        return df,line_idx_pos
     return -1 #no event occured 
 
 def get_targets(sgmts,line_idx_pos,lower_window=20,upper_window=20):
@@ -208,6 +209,16 @@ def get_window_values(sig_df,line_idx,win=600):
     bool_idx = (sig_df['lineIndex'] >= lower_win) & (sig_df['lineIndex'] <= upper_win)
     return sig_df[bool_idx]
 
+def query_window_values(comp,file,line_idx,dt,win=600):
+    """
+    same window as get_window_values but only the rows
+    of the window are read from the database
+    """
+    res = dt.dbconnector.query(comp+'_'+file,start=max(0,line_idx - win),end=line_idx + win)
+    if res is None or res == -1:
+        return pd.DataFrame()
+    return pd.DataFrame(res)
+
 def test_signal(yawdf,causedf):
     aldf = align_index(yawdf, causedf)
     mxlag = 20
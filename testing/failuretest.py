@@ -8,6 +8,16 @@ if module_path not in sys.path:
 from utils.utils import *
 
 from failure_detector.failuredetector import FailureDetector
+from failure_detector.rules import Rule, Check, ErrCode, absdiff, evaluate, select, dependencies, RULES, first_index
+
+def crash_on_log(logname, detector=None, labels=None, first_occurrence=False):
+    """detect_log of a worker that dies on the log 'crash'
+    """
+    import time
+    if logname == 'crash':
+        os._exit(1)
+    time.sleep(0.2) # the other logs are still in flight when the worker dies
+    return {'File Name': logname}
 
 class TestFailureMethods(unittest.TestCase):
     """
@@ -99,6 +109,156 @@ class TestFailureMethods(unittest.TestCase):
         self.assertEqual(self.fd.failures['Uncontrolled longitude'],True)
 
 
+    def test_altitude_false(self):
+        ctun_dalt = np.array([10,12,14,16])
+        ctun_baralt = np.array([9,12,15,13])
+        fd = FailureDetector()
+        fd.uc_altitude(None,None,ctun_baralt,None,ctun_dalt)
+        self.assertEqual(fd.failures['Uncontrolled altitude'],False)
+
+
+    def test_mech_undecided(self):
+        fd = FailureDetector()
+        fd.checkMech(np.array([1,12]),np.array([3,3]))
+        self.assertTrue(np.isnan(fd.failures['Mechanical Failure']))
+        fd.failures['Uncontrolled pitch'] = True
+        fd.checkMech(None,None)
+        self.assertEqual(fd.failures['Mechanical Failure'],True)
+
+
+    def test_rules(self):
+        rules = [Rule('Overspeed', [Check(['GPS_Spd', 'CTUN_DSpd'], '>', 10, absdiff),
+                                    ErrCode(subsys=11, ecode=2)])]
+        signals = {'GPS_Spd': np.array([1.0, 2.0, 30.0]), 'CTUN_DSpd': np.array([1.0, 2.0])}
+        self.assertEqual(evaluate(rules, signals), {'Overspeed': False})
+        signals['ERR_Subsys'] = np.array([11])
+        signals['ERR_ECode'] = np.array([2])
+        self.assertEqual(evaluate(rules, signals), {'Overspeed': True})
+        self.assertTrue(np.isnan(evaluate(rules, {})['Overspeed']))
+
+
+    def test_selected_labels(self):
+        rules = select(RULES, ['Mechanical Failure'])
+        self.assertEqual(sorted(dependencies(rules).keys()), ['ATT', 'ERR'])
+        tables = {'ATT': {'DesYaw': [0, 90], 'Yaw': [0, 0]},
+                  'GPS': {'NSats': [4, 4]}}
+        res = self.fd.evaluate(tables, 'log', labels=['Mechanical Failure'])
+        self.assertEqual(res['Mechanical Failure'], True)
+        self.assertTrue(np.isnan(res['GPS Failure']))
+        self.assertRaises(ValueError, select, RULES, ['Engine Failure'])
+
+
+    def test_first_occurrence(self):
+        self.assertEqual(first_index(np.array([False, True, True])), 1)
+        self.assertEqual(first_index(np.array([False, False])), -1)
+        tables = {'ATT': {'DesYaw': [0, 10, 90, 95], 'Yaw': [0, 0, 0, 0],
+                          'lineIndex': [3, 7, 11, 15], 'TimeMS': [100, 120, 140, 160]},
+                  'ERR': {'Subsys': [12], 'ECode': [1], 'lineIndex': [5]}}
+        res = self.fd.evaluate(tables, 'log', first_occurrence=True)
+        self.assertEqual(res['Uncontrolled yaw lineIndex'], 11)
+        self.assertEqual(res['Uncontrolled yaw Time'], 140)
+        # decided by the uncontrolled yaw, the error code is not looked at
+        self.assertEqual(res['Mechanical Failure lineIndex'], 11)
+        self.assertTrue(np.isnan(res['GPS Failure lineIndex']))
+
+
+    def test_stream_table(self):
+        import tempfile
+        import pandas as pd
+        fd = FailureDetector()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'failures.csv')
+            fd.stream_to(path, flush_rows=2)
+            for name in ['log1', 'log2', 'log3']:
+                fd.add_row({'File Name': name, 'GPS Failure': True, 'Detection Duration': 0.1})
+            self.assertEqual(len(pd.read_csv(path)), 2) # written before the end
+            fd.close_table()
+            df = pd.read_csv(path)
+            self.assertEqual(list(df['File Name']), ['log1', 'log2', 'log3'])
+            self.assertEqual(list(df.columns), FailureDetector.TABLE_COLUMNS)
+        self.assertEqual(len(fd.full_failure_table), 0)
+
+
+    def test_stream_restart(self):
+        import tempfile
+        import pandas as pd
+        from failure_detector import resultwriter
+        formats = ['failures.csv']
+        if resultwriter.pyarrow is not None:
+            formats.append('failures.parquet')
+        for name in formats:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, name)
+                read = pd.read_parquet if name.endswith('.parquet') else pd.read_csv
+                def run(lognames, mode):
+                    writer = FailureDetector.table_writer(path, flush_rows=2, mode=mode)
+                    for logname in lognames:
+                        writer.write({'File Name': logname, 'GPS Failure': False, 'Detection Duration': 0.1})
+                    return writer
+                run(['log1', 'log2', 'log3'], 'w') # crash: the third row is never flushed
+                self.assertEqual(list(read(path)['File Name']), ['log1', 'log2'])
+                run(['log3'], 'a').close()
+                df = read(path)
+                self.assertEqual(list(df['File Name']), ['log1', 'log2', 'log3'])
+                self.assertEqual(list(df.columns), FailureDetector.TABLE_COLUMNS)
+                run(['log4'], 'w').close()
+                self.assertEqual(list(read(path)['File Name']), ['log4'])
+
+
+    def test_detect_batch(self):
+        import tempfile
+        import pandas as pd
+        from db.storage import get_connector
+        from failure_detector.batch import detect_batch
+        fd = FailureDetector()
+        fd.dbconnector = get_connector('testdb', backend='memory')
+        fd.dbconnector.dropdb('testdb')
+        gps = {'NSats': np.array([12, 6]), 'HDop': np.array([1.0, 1.0]), 'lineIndex': np.arange(2)}
+        fd.dbconnector.insert_log('good', {'GPS': gps})
+        docs = fd.dbconnector._chunks(gps)
+        docs[0]['NSats']['data'] = docs[0]['NSats']['data'][:3] # truncated column
+        fd.dbconnector.write_docs('GPS_broken', docs)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'failures.csv')
+            rows = list(detect_batch(['broken', 'missing', 'good'], workers=1, detector=fd,
+                                     output=path))
+            self.assertEqual([row['File Name'] for row in rows], ['broken', 'missing', 'good'])
+            self.assertIn('Error', rows[0]) # the failing log does not stop the batch
+            self.assertNotIn('Error', rows[1])
+            self.assertTrue(np.isnan(rows[1]['GPS Failure']))
+            self.assertTrue(rows[2]['GPS Failure'])
+            df = pd.read_csv(path)
+            self.assertEqual(list(df['File Name']), ['broken', 'missing', 'good'])
+            self.assertEqual(list(df['Error'].isnull()), [False, True, True])
+            self.assertEqual(list(df['GPS Failure'].isnull()), [True, True, False])
+            self.assertTrue(df['GPS Failure'][2])
+
+    def test_detect_batch_worker_crash(self):
+        import failure_detector.batch
+        from failure_detector.batch import detect_batch
+        detect_log = failure_detector.batch.detect_log
+        backend = os.environ.get('DRONE_DB_BACKEND')
+        failure_detector.batch.detect_log = crash_on_log
+        os.environ['DRONE_DB_BACKEND'] = 'memory' # storage of the worker detectors
+        try:
+            lognames = ['log0', 'log1', 'crash', 'log3', 'log4', 'log5']
+            rows = list(detect_batch(lognames, workers=2))
+        finally:
+            failure_detector.batch.detect_log = detect_log
+            if backend is None:
+                del os.environ['DRONE_DB_BACKEND']
+            else:
+                os.environ['DRONE_DB_BACKEND'] = backend
+        self.assertEqual(sorted(row['File Name'] for row in rows), sorted(lognames))
+        errors = [row['File Name'] for row in rows if 'Error' in row]
+        self.assertEqual(errors, ['crash']) # the logs in flight with it are run again
+
+    def test_labels_from_rules(self):
+        self.assertEqual(FailureDetector.LABELS, [rule.label for rule in RULES])
+        row = self.fd.evaluate({}, 'empty')
+        # every label of a row is a column of the table, none is dropped by the writer
+        self.assertEqual(set(row) - set(FailureDetector.TABLE_COLUMNS), set())
+
     def test_all_var(self):
         """
         Tests if all 100 variables are within the ones
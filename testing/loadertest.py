@@ -0,0 +1,398 @@
+import unittest
+import numpy as np
+import os
+import sys
+import tempfile
+import struct
+module_path = os.path.abspath(os.path.join('..'))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+
+from dtloader.dataloader import DataLoader
+from dtloader.follow import LogFollower, GrowingTable
+from dtloader.logparser import LogParser
+import dtloader.ingest
+from dtloader.ingest import ingest_directory
+from dtloader.manifest import IngestManifest
+from db.storage import get_connector
+
+LOG_LINES = ['FMT, 128, 89, FMT, BBnNZ, Type,Length,Name,Format,Columns',
+             'FMT, 9, 19, ATT, IccccCC, TimeMS,RollIn,Roll,PitchIn,Pitch,YawIn,Yaw',
+             'FMT, 2, 45, GPS, BIHBcLLeeEefI, Status,TimeMS,Week,NSats,HDop,Lat,Lng,RAlt,Alt,Spd,GCrs,VZ,T',
+             'FMT, 13, 5, ERR, BB, Subsys,ECode',
+             'ATT, 1000, 0.5, 0.25, -1.5, -1.25, 10.5, 11',
+             'GPS, 3, 1000, 1800, 12, 1.5, 52.1234567, 4.7654321, 10.5, 12.5, 0.5, 180, 0.1, 1000',
+             '',
+             'ATT, 1020, 0.75, 0.5, -1, -1.5, 10, 12.5',
+             'ERR, 11, 2',
+             'GPS, 3, 1020, 1800, 11, 1.25, 52.1234568, 4.7654322, 10.75, 12.75, 0.75, 181, 0.2, 1020',
+             'ATT, 1040, 1, 0.75, -0.5, -1, 9.5, 13']
+
+INGEST_FILE = dtloader.ingest.ingest_file
+
+
+def crash_on_file(filepath, *args):
+    """ingest_file of a worker that dies on crash.log
+    """
+    import time
+    if os.path.basename(filepath) == 'crash.log':
+        os._exit(1)
+    time.sleep(0.2) # the other files are still in flight when the worker dies
+    return INGEST_FILE(filepath, *args)
+
+
+class TestDataLoader(unittest.TestCase):
+    """
+    This class tests the log parsing of the dataloader
+    """
+    @classmethod
+    def setUpClass(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.logpath = os.path.join(self.tmpdir.name, 'flight.log')
+        with open(self.logpath, 'w') as f:
+            f.write('\n'.join(LOG_LINES) + '\n')
+        self.binpath = os.path.join(self.tmpdir.name, 'flight.bin')
+        with open(self.binpath, 'wb') as f:
+            f.write(b'\xa3\x95\x80' + struct.pack('<BB4s16s64s', 9, 19, b'ATT', b'IccccCC',
+                                                  b'TimeMS,RollIn,Roll,PitchIn,Pitch,YawIn,Yaw'))
+            f.write(b'\xa3\x95\x80' + struct.pack('<BB4s16s64s', 13, 5, b'ERR', b'BB', b'Subsys,ECode'))
+            f.write(b'\xa3\x95\x09' + struct.pack('<IhhhhHH', 1000, 50, 25, -150, -125, 1050, 1100))
+            f.write(b'\xa3\x95\x0d' + struct.pack('<BB', 11, 2))
+            f.write(b'\xa3\x95\x09' + struct.pack('<IhhhhHH', 1020, 75, 50, -100, -150, 1000, 1250))
+        self.dl = DataLoader()
+
+    @classmethod
+    def tearDownClass(self):
+        self.tmpdir.cleanup()
+
+    def _extract(self, **kwargs):
+        self.dl.full_dict = {}
+        self.assertEqual(self.dl.load(self.logpath, **kwargs), 1)
+        self.dl.extractinfo(single_file=True)
+        return {c: d for (f, c), d in self.dl.full_dict.items()}
+
+    def test_extract_columns(self):
+        comps = self._extract()
+        self.assertEqual(sorted(comps.keys()), ['ATT', 'ERR', 'GPS'])
+        self.assertIn('DesRoll', comps['ATT'])
+        self.assertEqual(list(comps['ERR']['Subsys']), [11])
+        self.assertEqual(list(comps['ATT']['lineIndex']), [4, 6, 9])
+
+    def test_stream_same_as_dataframe(self):
+        logpath = os.path.join(self.tmpdir.name, 'text.log')
+        with open(logpath, 'w') as f: # with text columns that are not decoded
+            f.write('\n'.join(LOG_LINES + ['FMT, 10, 70, MSG, Z, Message',
+                                            'FMT, 14, 26, MODE, MhBB, Mode,ModeNum,Rsn,X',
+                                            'MSG, ArduCopter V3.2',
+                                            'MODE, Stabilize, 0, 1, 5',
+                                            'MODE, 300, Loiter, 5, 1']) + '\n')
+        loader = DataLoader()
+        outputs = []
+        for kwargs in ({}, {'stream': True, 'chunksize': 3}, {'stream': True, 'chunksize': 1}):
+            loader.full_dict = {}
+            self.assertEqual(loader.load(logpath, **kwargs), 1)
+            loader.extractinfo(single_file=True)
+            outputs.append({c: d for (f, c), d in loader.full_dict.items()})
+        full = outputs[0]
+        for streamed in outputs[1:]:
+            self._assert_same(full, streamed)
+        self.assertEqual(list(full['MSG']['Message']), ['ArduCopter V3.2'])
+        self.assertEqual(list(full['MODE']['Mode']), ['Stabilize', 300.0])
+        self.assertEqual(list(full['MODE']['ModeNum']), [0.0, 'Loiter'])
+
+    def _assert_same(self, full, streamed):
+        self.assertEqual(full.keys(), streamed.keys())
+        for comp in full:
+            self.assertEqual(full[comp].keys(), streamed[comp].keys())
+            for col in full[comp]:
+                if comp in ('MSG', 'MODE') and col != 'lineIndex':
+                    self.assertEqual(list(full[comp][col]), list(streamed[comp][col]))
+                    self.assertEqual([type(v) for v in full[comp][col]],
+                                     [type(v) for v in streamed[comp][col]])
+                else:
+                    np.testing.assert_allclose(np.array(full[comp][col], dtype=float),
+                                               np.array(streamed[comp][col], dtype=float))
+
+    def test_stream_buffers_bounded(self):
+        lines = LOG_LINES[:4] + ['ATT, {}, 1, 2, 3, 4, 5, 6'.format(t) for t in range(100)]
+        parser = LogParser(chunksize=8)
+        parser.parse(iter(lines))
+        att = parser.buffers['ATT']
+        self.assertEqual(len(att), 100)
+        self.assertEqual(len(att.pending), 0) # no text kept once the chunks are parsed
+        for col in att.columns:
+            for seg in col:
+                self.assertNotEqual(seg.dtype, object)
+        parser = LogParser(chunksize=8)
+        for i, line in enumerate(lines): # lines routed one by one
+            parser.route(line, i)
+            for buf in parser.buffers.values():
+                self.assertLess(len(buf.pending), 8)
+        self.assertEqual(parser.columns('ATT', ['TimeMS'])['TimeMS'].dtype, np.uint32)
+
+    def test_selected_components(self):
+        full = self._extract()
+        selected = self._extract(components=['ERR', 'GPS'])
+        self.assertEqual(sorted(selected.keys()), ['ERR', 'GPS'])
+        # without cache the index is not written next to the log
+        self.assertFalse(any(f.endswith('.idx.npz') for f in os.listdir(self.tmpdir.name)))
+        for comp in selected:
+            for col in full[comp]:
+                np.testing.assert_array_equal(full[comp][col], selected[comp][col])
+
+    def test_binary_log(self):
+        for use_mmap in (False, True):
+            self.dl.full_dict = {}
+            self.assertEqual(self.dl.load(self.binpath, use_mmap=use_mmap), 1)
+            reader = self.dl.reader
+            data = reader.data
+            self.dl.extractinfo(single_file=True)
+            self.assertIsNone(reader.data) # released once extracted
+            if use_mmap:
+                self.assertTrue(data.closed)
+            comps = {c: d for (f, c), d in self.dl.full_dict.items()}
+            self.assertEqual(sorted(comps.keys()), ['ATT', 'ERR'])
+            np.testing.assert_allclose(comps['ATT']['DesRoll'], [0.5, 0.75])
+            np.testing.assert_allclose(comps['ATT']['Yaw'], [11, 12.5])
+            self.assertEqual(list(comps['ERR']['ECode']), [2])
+            self.assertEqual(list(comps['ATT']['lineIndex']), [2, 4])
+
+    def test_follow_growing_log(self):
+        full = self._extract()
+        path = os.path.join(self.tmpdir.name, 'growing.log')
+        open(path, 'w').close()
+        follower = LogFollower(path)
+        text = '\n'.join(LOG_LINES) + '\n'
+        for i in range(0, len(text), 100): # lines are cut in the middle
+            with open(path, 'a') as f:
+                f.write(text[i:i + 100])
+            follower.poll()
+        for comp in full:
+            got = follower.component(comp)
+            for col in full[comp]:
+                np.testing.assert_allclose(np.array(full[comp][col], dtype=float),
+                                           np.array(got[col], dtype=float))
+
+    def test_growing_table(self):
+        table = GrowingTable()
+        buffers = set()
+        for i in range(100):
+            table.append({'TimeMS': [2 * i, 2 * i + 1], 'Mode': ['Loiter', np.nan]})
+            buffers.add(id(table.buffers['TimeMS']))
+        self.assertLess(len(buffers), 10) # the buffers double, they are not copied every poll
+        table.append({'TimeMS': [200.5], 'Mode': ['Land']})
+        cols = table.columns()
+        np.testing.assert_array_equal(cols['TimeMS'][:3], [0, 1, 2])
+        self.assertEqual(cols['TimeMS'][-1], 200.5)
+        self.assertEqual(len(cols['Mode']), 201)
+        self.assertEqual(cols['Mode'][-1], 'Land')
+        self.assertTrue(np.isnan(cols['Mode'][1]))
+
+    def test_follow_detection(self):
+        from failure_detector.failuredetector import FailureDetector
+        gps = 'GPS, 3, {0}, 1800, {1}, 1.5, 52.1234567, 4.7654321, {2}, 12.5, 0.5, 180, 0.1, {0}'
+        baro = 'BARO, {0}, {1}, 101325, 25, 0.1'
+        polls = [[LOG_LINES[0], LOG_LINES[2], 'FMT, 15, 40, BARO, Iffcf, TimeMS,Alt,Press,Temp,CRt',
+                  gps.format(1000, 12, 10), gps.format(1020, 12, 20), baro.format(1000, 10)],
+                 # paired with the GPS rows of the same poll the altitudes would differ by 10
+                 [baro.format(1020, 20), gps.format(1040, 12, 30), baro.format(1040, 30)],
+                 [gps.format(1060, 6, 40), baro.format(1060, 40)]]
+        path = os.path.join(self.tmpdir.name, 'detected.log')
+        open(path, 'w').close()
+        detected = []
+        follower = LogFollower(path, detector=FailureDetector(),
+                               on_failure=lambda label, flags: detected.append(label))
+        for lines in polls:
+            with open(path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+            follower.poll()
+            self.assertFalse(follower.flags['Uncontrolled altitude'])
+            self.assertEqual(max(follower.loader.var_counts.values()), 1)
+        self.assertTrue(follower.flags['GPS Failure'])
+        self.assertEqual(detected, ['GPS Failure'])
+        np.testing.assert_allclose(follower.component('BARO')['Alt'], [10, 20, 30, 40])
+
+    def test_parallel_ingest(self):
+        logdir = os.path.join(self.tmpdir.name, 'parallel_logs')
+        os.makedirs(logdir)
+        logs = {'a.log': LOG_LINES,
+                'b.log': [line for line in LOG_LINES if not line.startswith('ERR')],
+                'empty.log': LOG_LINES[:1]} # broken, a single line
+        for name, lines in logs.items():
+            with open(os.path.join(logdir, name), 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+        outputs = []
+        for workers in (1, 2):
+            loader = DataLoader()
+            report = ingest_directory(logdir, workers=workers, loader=loader)
+            outputs.append((report.drop('duration s', axis=1), loader.var_counts, loader.errors_list))
+        (serial, serial_counts, serial_errors), (parallel, parallel_counts, parallel_errors) = outputs
+        self.assertEqual(list(serial['status']), [1, 1, -2])
+        self.assertTrue(serial.equals(parallel))
+        self.assertEqual(serial_counts, parallel_counts)
+        self.assertEqual(serial_counts['ATT_Yaw'], 2)
+        self.assertEqual(serial_errors, parallel_errors)
+        self.assertEqual(serial_errors, [-2])
+
+    def test_cache(self):
+        import dtloader.cache
+        from dtloader.cache import CachedLog
+        logpath = os.path.join(self.tmpdir.name, 'cached.log')
+        with open(logpath, 'w') as f:
+            f.write('\n'.join(LOG_LINES) + '\n')
+        loader = DataLoader(cache_dir=os.path.join(self.tmpdir.name, 'cache'))
+
+        def extract():
+            loader.full_dict = {}
+            self.assertEqual(loader.load(logpath), 1)
+            loader.extractinfo(single_file=True)
+            return {c: d for (f, c), d in loader.full_dict.items()}
+
+        parsed = extract()
+        self.assertNotIsInstance(loader.reader, CachedLog)
+        cached = extract()
+        self.assertIsInstance(loader.reader, CachedLog)
+        self.assertEqual(list(cached.keys()), list(parsed.keys()))
+        for comp in parsed:
+            self.assertEqual(list(cached[comp].keys()), list(parsed[comp].keys()))
+            for col in parsed[comp]:
+                self.assertEqual(np.asarray(cached[comp][col]).dtype, np.asarray(parsed[comp][col]).dtype)
+                np.testing.assert_array_equal(cached[comp][col], parsed[comp][col])
+        # another parser version does not read the entries of the previous one
+        version = dtloader.cache.PARSER_VERSION
+        dtloader.cache.PARSER_VERSION = version + 1
+        try:
+            extract()
+            self.assertNotIsInstance(loader.reader, CachedLog)
+        finally:
+            dtloader.cache.PARSER_VERSION = version
+        # changed content
+        with open(logpath, 'a') as f:
+            f.write('ATT, 1060, 1, 0.75, -0.5, -1, 9.5, 13\n')
+        changed = extract()
+        self.assertNotIsInstance(loader.reader, CachedLog)
+        self.assertEqual(list(changed['ATT']['TimeMS']), [1000, 1020, 1040, 1060])
+        # an extraction failing partway leaves nothing in the cache
+        with open(logpath, 'a') as f:
+            f.write('ATT, 1080, 1, 0.75, -0.5, -1, 9.5, 13\n')
+        def broken(values, ch):
+            raise ValueError('broken column')
+        loader._convert_column = broken
+        self.assertEqual(loader.load(logpath), 1)
+        with self.assertRaises(ValueError):
+            loader.extractinfo(single_file=True)
+        del loader._convert_column
+        self.assertFalse(loader.cache.exists(loader.cache_key))
+        self.assertEqual([d for d in os.listdir(loader.cache.cache_dir) if '.tmp' in d], [])
+
+    def test_compressed_logs(self):
+        import gzip
+        import lzma
+        from dtloader.compression import compression, strip_extension
+        full = self._extract()
+        selected = {'ATT': full['ATT']}
+        self.dl.full_dict = {}
+        self.dl.load(self.binpath)
+        self.dl.extractinfo(single_file=True)
+        binary = {c: d for (f, c), d in self.dl.full_dict.items()}
+        for kind, module, ext in (('gzip', gzip, '.gz'), ('xz', lzma, '.xz')):
+            logpath = self.logpath + ext
+            binpath = self.binpath + ext
+            with open(self.logpath, 'rb') as f, module.open(logpath, 'wb') as out:
+                out.write(f.read())
+            with open(self.binpath, 'rb') as f, module.open(binpath, 'wb') as out:
+                out.write(f.read())
+            self.assertEqual(compression(logpath), kind)
+            self.assertEqual(strip_extension(logpath), self.logpath)
+            for kwargs, expected in (({}, full), ({'stream': True}, full),
+                                     ({'components': ['ATT']}, selected)):
+                self.dl.full_dict = {}
+                self.assertEqual(self.dl.load(logpath, **kwargs), 1)
+                self.dl.extractinfo(single_file=True)
+                got = {c: d for (f, c), d in self.dl.full_dict.items()}
+                self.assertEqual(sorted(got.keys()), sorted(expected.keys()))
+                for comp in expected:
+                    for col in expected[comp]:
+                        np.testing.assert_array_equal(expected[comp][col], got[comp][col])
+            for use_mmap in (False, True): # decompressed in memory, never memory-mapped
+                self.dl.full_dict = {}
+                self.assertEqual(self.dl.load(binpath, use_mmap=use_mmap), 1)
+                self.dl.extractinfo(single_file=True)
+                got = {c: d for (f, c), d in self.dl.full_dict.items()}
+                self.assertEqual(sorted(got.keys()), sorted(binary.keys()))
+                for comp in binary:
+                    for col in binary[comp]:
+                        np.testing.assert_array_equal(binary[comp][col], got[comp][col])
+        self.assertIsNone(compression(self.logpath))
+
+    def test_ingest_worker_crash(self):
+        logdir = os.path.join(self.tmpdir.name, 'crash_logs')
+        os.makedirs(logdir)
+        names = ['a.log', 'b.log', 'c.log', 'crash.log', 'd.log']
+        for name in names:
+            with open(os.path.join(logdir, name), 'w') as f:
+                f.write('\n'.join(LOG_LINES) + '\n')
+        backend = os.environ.get('DRONE_DB_BACKEND')
+        dtloader.ingest.ingest_file = crash_on_file
+        os.environ['DRONE_DB_BACKEND'] = 'memory' # storage of the worker dataloaders
+        try:
+            loader = DataLoader()
+            report = ingest_directory(logdir, workers=2, loader=loader)
+        finally:
+            dtloader.ingest.ingest_file = INGEST_FILE
+            if backend is None:
+                del os.environ['DRONE_DB_BACKEND']
+            else:
+                os.environ['DRONE_DB_BACKEND'] = backend
+        self.assertEqual(list(report['logname']), names)
+        self.assertEqual(list(report['status']), [1, 1, 1, -6, 1])
+        self.assertEqual(loader.var_counts['ATT_Yaw'], 4)
+
+    def test_manifest_retry(self):
+        logdir = os.path.join(self.tmpdir.name, 'manifest_logs')
+        os.makedirs(logdir)
+        logpath = os.path.join(logdir, 'flight.log')
+        with open(logpath, 'w') as f:
+            f.write('\n'.join(LOG_LINES) + '\n')
+        manifest = os.path.join(self.tmpdir.name, 'manifest.json')
+        loader = DataLoader()
+        loader.dbconnector = get_connector('testdb', backend='memory')
+        loader.dbconnector.dropdb('testdb')
+        cname = [None]
+
+        def att_times():
+            if cname[0] is None:
+                cname[0] = [c for c in loader.dbconnector.list_collection_names() if c.startswith('ATT_')][0]
+            return list(loader.dbconnector.query(cname[0], 'TimeMS'))
+
+        report = ingest_directory(logdir, workers=1, export=True, loader=loader, manifest=manifest)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(att_times(), [1000, 1020, 1040])
+        # unchanged, skipped
+        report = ingest_directory(logdir, workers=1, export=True, loader=loader, manifest=manifest)
+        self.assertEqual(len(report), 0)
+        # failed last time, retried without appending a second copy
+        m = IngestManifest(manifest)
+        m.record(logpath, False)
+        m.save()
+        report = ingest_directory(logdir, workers=1, export=True, loader=loader, manifest=manifest)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(att_times(), [1000, 1020, 1040])
+        # changed, replaced
+        with open(logpath, 'a') as f:
+            f.write('ATT, 1060, 1, 0.75, -0.5, -1, 9.5, 13\n')
+        report = ingest_directory(logdir, workers=1, export=True, loader=loader, manifest=manifest)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(att_times(), [1000, 1020, 1040, 1060])
+        # new manifest over a database already ingested, e.g. with a component the log lost
+        logname = cname[0].split('_', 1)[1]
+        loader.dbconnector.insert_log(logname, {'MAG': {'MagX': np.ones(2), 'lineIndex': np.arange(2)}})
+        os.remove(manifest)
+        report = ingest_directory(logdir, workers=1, export=True, loader=loader, manifest=manifest)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(att_times(), [1000, 1020, 1040, 1060])
+        self.assertEqual(loader.dbconnector.catalog.lookup(logname, 'MAG'), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
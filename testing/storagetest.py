@@ -0,0 +1,276 @@
+import unittest
+import numpy as np
+import os
+import sys
+import tempfile
+module_path = os.path.abspath(os.path.join('..'))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+
+import db.storage
+from db.storage import get_connector
+from db.signalcache import SignalCache
+
+COMPONENT = {'TimeMS': np.arange(25) * 20,
+             'Yaw': np.linspace(0, 12, 25),
+             'Mode': ['Stabilize'] * 12 + [np.nan] * 13,
+             'lineIndex': np.arange(25) * 2 + 4}
+
+
+class TestStorage(unittest.TestCase):
+    """
+    This class tests the server-less storage backends
+    """
+    @classmethod
+    def setUpClass(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.chunk_rows = db.storage.CHUNK_ROWS
+        db.storage.CHUNK_ROWS = 10 # several chunks per component
+
+    @classmethod
+    def tearDownClass(self):
+        db.storage.CHUNK_ROWS = self.chunk_rows
+        self.tmpdir.cleanup()
+
+    def _backends(self):
+        return [get_connector('testdb', backend='memory'),
+                get_connector('testdb', backend='directory', path=self.tmpdir.name)]
+
+    def test_insert_query(self):
+        for storage in self._backends():
+            storage.dropdb('testdb')
+            status = storage.insert_log('flight', {'ATT': COMPONENT})
+            self.assertEqual(status, {'ATT': None})
+            res = storage.query('ATT_flight')
+            self.assertEqual(list(res.keys()), list(COMPONENT.keys()))
+            np.testing.assert_allclose(res['Yaw'], COMPONENT['Yaw'])
+            self.assertEqual(res['Mode'][:12], COMPONENT['Mode'][:12])
+            self.assertTrue(np.isnan(res['Mode'][-1]))
+            self.assertEqual(storage.query('ATT_flight', 'nope'), -1)
+
+    def test_insert_twice(self):
+        for storage in self._backends():
+            storage.dropdb('testdb')
+            storage.insert_log('flight', {'ATT': COMPONENT})
+            storage.insert_log('flight', {'ATT': COMPONENT}) # e.g. the export loop run again
+            np.testing.assert_array_equal(storage.query('ATT_flight', 'TimeMS'), COMPONENT['TimeMS'])
+            self.assertEqual(len(storage.read_docs('ATT_flight')), 3)
+            self.assertNotIn('_staging_ATT_flight', storage.list_collection_names())
+        # chunks appended twice by an older version, the first copy is read
+        storage.write_docs('ATT_flight', storage._chunks(COMPONENT))
+        np.testing.assert_array_equal(storage.query('ATT_flight', 'TimeMS'), COMPONENT['TimeMS'])
+
+    def test_directory_no_pickle(self):
+        storage = get_connector('testdb', backend='directory', path=self.tmpdir.name)
+        storage.dropdb('testdb')
+        storage.insert_log('flight', {'ATT': COMPONENT})
+        res = storage.query('ATT_flight', 'Mode') # strings and nan, stored as json
+        self.assertEqual(res[:12], COMPONENT['Mode'][:12])
+        self.assertTrue(np.isnan(res[-1]))
+        # an object array planted in the store is not unpickled
+        chunk = os.path.join(storage._dir('ATT_flight'), '0.npz')
+        np.savez(chunk, **{'0': np.array([object()], dtype=object)})
+        with self.assertRaises(ValueError):
+            storage.read_docs('ATT_flight')
+
+    def test_packed_columns(self):
+        storage = get_connector('testdb', backend='memory')
+        docs = storage._chunks(COMPONENT)
+        self.assertEqual(docs[0]['Yaw']['dtype'], '<f8')
+        self.assertIsInstance(docs[0]['Mode'], list)
+        yaw = storage._assemble(docs, 'Yaw')
+        self.assertEqual(yaw.dtype, np.float64)
+        np.testing.assert_array_equal(yaw, COMPONENT['Yaw'])
+
+    def test_window(self):
+        for storage in self._backends():
+            storage.dropdb('testdb')
+            storage.insert_log('flight', {'ATT': COMPONENT})
+            res = storage.query('ATT_flight', ['Yaw', 'lineIndex'], start=20, end=31)
+            self.assertEqual(list(res['lineIndex']), [20, 22, 24, 26, 28, 30])
+            self.assertEqual(sorted(res.keys()), ['Yaw', 'lineIndex'])
+
+    def test_catalog(self):
+        for storage in self._backends():
+            storage.dropdb('testdb')
+            storage.insert_log('flight', {'GPS2': COMPONENT})
+            self.assertEqual(storage.catalog.lookup('flight', 'GPS'), -1)
+            storage.insert_log('flight', {'GPS': COMPONENT}, replace=True)
+            self.assertEqual(storage.catalog.lookup('flight', 'GPS'), 'GPS_flight')
+            storage.drop_collection('GPS2_flight')
+            self.assertEqual(storage.catalog.components('flight'), ['GPS'])
+
+    def test_incomplete_backend(self):
+        class NoVersion(db.storage.MemoryStorage):
+            collection_version = db.storage.Storage.collection_version
+        with self.assertRaises(TypeError): # fails when created, not on the first read
+            NoVersion('testdb')
+
+    def test_catalog_batched(self):
+        storage = get_connector('testdb', backend='memory')
+        storage.dropdb('testdb')
+        storage.catalog.entries = None
+        puts = []
+        def no_listing():
+            raise AssertionError('the catalog is read to write')
+        storage.catalog_put = puts.append
+        storage.catalog_entries = no_listing
+        storage.insert_log('flight', {'ATT': COMPONENT, 'GPS': COMPONENT})
+        self.assertEqual(len(puts), 1) # one catalog update per log
+        self.assertEqual(sorted(entry[1] for entry in puts[0]), ['ATT', 'GPS'])
+        del storage.catalog_entries
+        self.assertEqual(storage.catalog.lookup('flight', 'GPS'), 'GPS_flight')
+
+    def test_fetch_signals(self):
+        storage = get_connector('testdb', backend='memory')
+        storage.dropdb('testdb')
+        gps = {'Alt': np.array([1.0, 2.0]), 'lineIndex': np.array([5, 9])}
+        storage.insert_log('flight', {'ATT': COMPONENT, 'GPS': gps})
+        res = storage.fetch_signals('flight', ['ATT_Yaw', 'GPS_Alt', 'MAG_MagX'])
+        self.assertEqual(sorted(res.keys()), ['ATT_Yaw', 'GPS_Alt'])
+        np.testing.assert_array_equal(res['GPS_Alt'], gps['Alt'])
+        res = storage.fetch_signals('flight', {'ATT': ['Yaw'], 'GPS': ['Alt']}, align='lineIndex')
+        self.assertEqual(list(res['lineIndex'][:5]), [4, 5, 6, 8, 9])
+        np.testing.assert_array_equal(res['GPS_Alt'][:5], [np.nan, 1, 1, 1, 2])
+        self.assertEqual(len(res['ATT_Yaw']), len(res['lineIndex']))
+
+    def test_signal_cache(self):
+        cache = SignalCache(max_bytes=2000)
+        cache.put(('flight', 'ATT', 'Yaw', 1), np.zeros(100)) # 800 bytes
+        cache.put(('flight', 'ATT', 'Roll', 1), np.zeros(100))
+        self.assertTrue(cache.get(('flight', 'ATT', 'Yaw', 1))[0]) # Roll is now the oldest
+        cache.put(('flight', 'GPS', 'Alt', 1), np.zeros(100))
+        self.assertNotIn(('flight', 'ATT', 'Roll', 1), cache)
+        self.assertFalse(cache.get(('flight', 'ATT', 'Yaw', 2))[0])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertLessEqual(cache.nbytes, 2000)
+
+    def test_cached_query(self):
+        storage = get_connector('testdb', backend='memory', cache_mb=1)
+        storage.dropdb('testdb')
+        storage.insert_log('flight', {'ATT': COMPONENT})
+        yaw = storage.query('ATT_flight', 'Yaw')
+        self.assertIs(storage.query('ATT_flight', 'Yaw'), yaw)
+        storage.insert_log('flight', {'ATT': {'Yaw': np.ones(3), 'lineIndex': np.arange(3)}},
+                           replace=True)
+        np.testing.assert_array_equal(storage.query('ATT_flight', 'Yaw'), np.ones(3))
+
+
+    def test_cached_read_without_listing(self):
+        storage = get_connector('testdb', backend='directory', path=self.tmpdir.name, cache_mb=1)
+        storage.dropdb('testdb')
+        storage.insert_log('flight', {'ATT': COMPONENT})
+        storage.query('ATT_flight', 'Yaw')
+        def list_collection_names():
+            raise AssertionError('the whole store is listed')
+        storage.list_collection_names = list_collection_names
+        self.assertTrue(storage.collection_exists('ATT_flight'))
+        self.assertFalse(storage.collection_exists('GPS_flight'))
+        np.testing.assert_allclose(storage.query('ATT_flight', 'Yaw'), COMPONENT['Yaw'])
+
+
+
+class FakeClient():
+    def __init__(self, uri, **kwargs):
+        self.uri = uri
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnection(unittest.TestCase):
+    """
+    This class tests the clients shared by the database connectors,
+    MongoClient is replaced so no server is needed
+    """
+    def setUp(self):
+        import db.connection
+        self.connection = db.connection
+        self.mongo_client = db.connection.pymongo.MongoClient
+        db.connection.pymongo.MongoClient = FakeClient
+        db.connection.close_all()
+
+    def tearDown(self):
+        self.connection.close_all()
+        self.connection.pymongo.MongoClient = self.mongo_client
+
+    def test_refcount(self):
+        get_client, release_client = self.connection.get_client, self.connection.release_client
+        client = get_client('mongodb://a:27017/')
+        self.assertIs(get_client('mongodb://a:27017/'), client) # shared
+        other = get_client('mongodb://b:27017/')
+        self.assertIsNot(other, client)
+        release_client(client)
+        self.assertFalse(client.closed) # still used by a connector
+        release_client(client)
+        self.assertTrue(client.closed)
+        self.assertFalse(other.closed)
+        self.assertIsNot(get_client('mongodb://a:27017/'), client) # closed clients are not reused
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+    def test_reset_after_fork(self):
+        client = self.connection.get_client('mongodb://a:27017/')
+        pid = os.fork()
+        if pid == 0: # child, the client of the parent is not reused nor closed
+            ok = (len(self.connection._clients) == 0
+                  and self.connection.get_client('mongodb://a:27017/') is not client
+                  and not client.closed)
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertIs(self.connection.get_client('mongodb://a:27017/'), client)
+        self.connection._pid = -1 # forked without register_at_fork, noticed from the pid
+        self.assertIsNot(self.connection.get_client('mongodb://a:27017/'), client)
+
+
+
+def mongomock_client():
+    """returns a mongomock client if mongomock is installed and supports
+    the bulk writes of the installed pymongo, None otherwise
+    """
+    try:
+        import mongomock
+        import pymongo
+        client = mongomock.MongoClient()
+        client['probe']['probe'].bulk_write([pymongo.ReplaceOne({'a': 1}, {'a': 1}, upsert=True)])
+        return client
+    except Exception:
+        return None
+
+
+class TestLegacyDatabase(unittest.TestCase):
+    """
+    This class tests a MongoDB database written before the catalog existed,
+    on mongomock (skipped without it)
+    """
+    def setUp(self):
+        import db.connection
+        self.client = mongomock_client()
+        if self.client is None:
+            self.skipTest('requires a mongomock compatible with pymongo')
+        self.connection = db.connection
+        self.mongo_client = db.connection.pymongo.MongoClient
+        db.connection.pymongo.MongoClient = lambda *args, **kwargs: self.client
+        db.connection.close_all()
+
+    def tearDown(self):
+        self.connection.close_all()
+        self.connection.pymongo.MongoClient = self.mongo_client
+
+    def test_first_write(self):
+        from db.database import DatabaseConnector
+        # single document per collection and no _catalog, as written by the old code
+        self.client['legacydb']['GPS_oldlog'].insert_one({'NSats': [4, 4], 'lineIndex': [0, 1]})
+        storage = DatabaseConnector('legacydb')
+        storage.insert_log('newlog', {'GPS': {'NSats': np.array([12, 12]), 'lineIndex': np.arange(2)}})
+        for connector in (storage, DatabaseConnector('legacydb')):
+            self.assertEqual(connector.catalog.lookup('oldlog', 'GPS'), 'GPS_oldlog')
+            self.assertEqual(sorted(connector.catalog.components('oldlog')), ['GPS'])
+            self.assertEqual(list(connector.fetch_signals('oldlog', ['GPS_NSats'])['GPS_NSats']), [4, 4])
+            self.assertEqual(connector.catalog.lookup('newlog', 'GPS'), 'GPS_newlog')
+
+
+if __name__ == '__main__':
+    unittest.main()